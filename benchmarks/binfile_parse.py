@@ -0,0 +1,93 @@
+# Times BinFile parsing, on the bin files given as arguments or on a synthetic one, against the
+# previous stream parser kept in binfile_reference.py.
+#   python benchmarks/binfile_parse.py [--repeat N] [--entries N] [--lazy] [--compact] [--numeric-arrays array|numpy] [--cache DIR] [--no-reference] [file.bin ...]
+import argparse
+import io
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lol_parser.binfile import BinFile, BinFileCache, BinFileFieldHashType as T
+from binfile_reference import ReferenceBinFile
+
+
+def _field(key, field_type, payload):
+    return struct.pack("<IB", key, field_type.value) + payload
+
+
+def _string(s):
+    data = s.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _embedded(rnd, class_hash):
+    fields = [
+        _field(rnd.getrandbits(32), T.FLOAT, struct.pack("<f", rnd.random())),
+        _field(rnd.getrandbits(32), T.VECTOR3_FLOAT, struct.pack("<3f", rnd.random(), rnd.random(), rnd.random())),
+        _field(rnd.getrandbits(32), T.HASH, struct.pack("<I", rnd.getrandbits(32))),
+        _field(rnd.getrandbits(32), T.BOOL, struct.pack("<?", True)),
+    ]
+    body = struct.pack("<H", len(fields)) + b"".join(fields)
+    return struct.pack("<II", class_hash, len(body)) + body
+
+
+def synthetic_bin(entries_count, seed=0):
+    rnd = random.Random(seed)
+    out = [b"PROP", struct.pack("<II", 1, entries_count), struct.pack("<{}I".format(entries_count), *(rnd.getrandbits(8) for _ in range(entries_count)))]
+    for _ in range(entries_count):
+        floats = struct.pack("<24f", *(rnd.random() for _ in range(24)))
+        embeds = b"".join(_embedded(rnd, 0x1234) for _ in range(4))
+        fields = [
+            _field(rnd.getrandbits(32), T.STRING, _string("ASSETS/Characters/Foo/Skins/Base/foo.dds")),
+            _field(rnd.getrandbits(32), T.UINT32, struct.pack("<I", rnd.getrandbits(32))),
+            _field(rnd.getrandbits(32), T.MATRIX_4X4, struct.pack("<16f", *(rnd.random() for _ in range(16)))),
+            _field(rnd.getrandbits(32), T.RGBA, struct.pack("<4B", 1, 2, 3, 4)),
+            _field(rnd.getrandbits(32), T.FIELD_LIST, struct.pack("<BII", T.FLOAT.value, len(floats) + 4, 24) + floats),
+            _field(rnd.getrandbits(32), T.FIELD_LIST, struct.pack("<BII", T.EMBEDDED.value, len(embeds) + 4, 4) + embeds),
+            _field(rnd.getrandbits(32), T.EMBEDDED, _embedded(rnd, 0x5678)),
+        ]
+        body = struct.pack("<IH", rnd.getrandbits(32), len(fields)) + b"".join(fields)
+        out.append(struct.pack("<I", len(body)))
+        out.append(body)
+    return b"".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--numeric-arrays", choices=("array", "numpy"))
+    parser.add_argument("--cache", help="BinFileCache directory, filled on the first run")
+    parser.add_argument("--no-reference", action="store_true", help="don't time the previous parser")
+    args = parser.parse_args()
+    cache = BinFileCache(args.cache) if args.cache else None
+
+    if args.files:
+        samples = []
+        for path in args.files:
+            with io.open(path, "rb") as bin_file:
+                samples.append((path, bin_file.read()))
+    else:
+        samples = [("synthetic ({} entries)".format(args.entries), synthetic_bin(args.entries))]
+
+    for name, data in samples:
+        best = min(timeit.repeat(lambda: BinFile(buffer=io.BytesIO(data), lazy=args.lazy, numeric_arrays=args.numeric_arrays, cache=cache, compact=args.compact), number=1, repeat=args.repeat))
+        print("{}: {:.1f} ms, {:.2f} MB/s".format(name, best * 1000, len(data) / best / 1024 / 1024))
+        if args.no_reference:
+            continue
+        try:
+            reference = min(timeit.repeat(lambda: ReferenceBinFile(buffer=io.BytesIO(data)), number=1, repeat=args.repeat))
+        except NotImplementedError as e: # PTCH and version 3 bins
+            print("  reference: {}".format(e))
+            continue
+        print("  reference: {:.1f} ms, {:.1f}x faster".format(reference * 1000, reference / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# Times PackageManifest.download_all and download_bin against a local HTTP server serving a
+# synthetic release, and checks the downloaded files. The server can fail the first request of a
+# fraction of the files with a 503 (retries), delay its answers and ignore Range headers.
+#   python benchmarks/packagemanifest_download.py [--files N] [--bins N] [--workers N] [--per-host N] [--gap N] [--fail-rate F] [--latency MS] [--no-range]
+import argparse
+import http.server
+import io
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import lol_parser.packagemanifest as packagemanifest
+from lol_parser.packagemanifest import PackageManifest
+
+RELEASE_PATH = "projects/bench/releases/0.0.0.1"
+
+
+class StandInState(object):
+    def __init__(self, fail_paths, latency, ignore_range):
+        self.fail_paths = fail_paths
+        self.latency = latency
+        self.ignore_range = ignore_range
+        self.requests = 0
+        self.ranges = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+def make_server(root, state):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True # Headers and body are separate writes, each answer would wait for a delayed ACK
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state.lock:
+                state.requests += 1
+                state.active += 1
+                state.max_active = max(state.max_active, state.active)
+                fail = self.path in state.fail_paths
+                state.fail_paths.discard(self.path)
+            try:
+                time.sleep(state.latency)
+                path = os.path.join(root, self.path.lstrip("/"))
+                if fail or not os.path.isfile(path):
+                    with state.lock:
+                        state.failures += fail
+                    self.send_response(503 if fail else 404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                with io.open(path, "rb") as served_file:
+                    data = served_file.read()
+                match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range") or "")
+                if match and not state.ignore_range:
+                    start, end = int(match.group(1)), int(match.group(2))
+                    body = data[start:end + 1]
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes {}-{}/{}".format(start, start + len(body) - 1, len(data)))
+                    with state.lock:
+                        state.ranges += 1
+                else:
+                    body = data
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError): # The client stopped reading, see download_bin
+                    self.close_connection = True
+                    return
+                with state.lock:
+                    state.bytes_sent += len(body)
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Writes every file both on its own (for download_all) and packed with gaps in BIN files (for
+# download_bin). Returns the package manifest text and the expected content by release path.
+def synthetic_release(root, files_count, bins_count, seed=0):
+    rnd = random.Random(seed)
+    packages_dir = os.path.join(root, RELEASE_PATH, "packages", "files")
+    os.makedirs(packages_dir)
+    bins = [bytearray() for _ in range(bins_count)]
+
+    lines = ["PKG1"]
+    expected = {}
+    for idx in range(files_count):
+        raw = rnd.randbytes(rnd.randint(0, 20000)) if idx % 3 else b"lol" * rnd.randint(0, 20000)
+        compressed = idx % 2 == 0
+        stored = zlib.compress(raw) if compressed else raw
+        release_path = "DATA/Files{}/file{}.dat".format(idx % 7, idx)
+        file_path = "/{}/files/{}{}".format(RELEASE_PATH, release_path, ".compressed" if compressed else "")
+        os.makedirs(os.path.dirname(os.path.join(root, file_path.lstrip("/"))), exist_ok=True)
+        with io.open(os.path.join(root, file_path.lstrip("/")), "wb") as out_file:
+            out_file.write(stored)
+
+        bin_idx = rnd.randrange(bins_count)
+        bins[bin_idx] += rnd.randbytes(rnd.choice((0, 0, 100, 100000)))
+        lines.append("{},BIN_0x{:08x},{},{},0".format(file_path, bin_idx, len(bins[bin_idx]), len(stored)))
+        bins[bin_idx] += stored
+        expected[release_path] = raw
+
+    for bin_idx, data in enumerate(bins):
+        with io.open(os.path.join(packages_dir, "BIN_0x{:08x}".format(bin_idx)), "wb") as bin_file:
+            bin_file.write(data)
+    return "\r\n".join(lines) + "\r\n", expected
+
+
+def check(out_dir, expected, by_name):
+    bad = 0
+    for release_path, raw in expected.items():
+        path = os.path.join(out_dir, os.path.basename(release_path) if by_name else release_path)
+        with io.open(path, "rb") as out_file:
+            bad += out_file.read() != raw
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--bins", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=packagemanifest.DOWNLOAD_WORKERS)
+    parser.add_argument("--per-host", type=int, default=packagemanifest.DOWNLOAD_HOST_CONNECTIONS)
+    parser.add_argument("--gap", type=int, default=packagemanifest.DOWNLOAD_RANGE_GAP)
+    parser.add_argument("--fail-rate", type=float, default=0.05, help="fraction of the files whose first request gets a 503")
+    parser.add_argument("--latency", type=float, default=5, help="milliseconds before each answer")
+    parser.add_argument("--no-range", action="store_true", help="answer Range requests with the whole file")
+    parser.add_argument("--backoff", type=float, default=0.01, help="replaces DOWNLOAD_BACKOFF")
+    args = parser.parse_args()
+
+    packagemanifest.DOWNLOAD_BACKOFF = args.backoff
+    root = tempfile.mkdtemp()
+    try:
+        manifest_data, expected = synthetic_release(os.path.join(root, "www"), args.files, args.bins)
+        state = StandInState(set(), args.latency / 1000, args.no_range)
+        server = make_server(os.path.join(root, "www"), state)
+        base_url = "http://127.0.0.1:{}/".format(server.server_address[1])
+        manifest = PackageManifest(manifest_data, packages_url="{}{}/packages/files/".format(base_url, RELEASE_PATH))
+
+        failed = 0
+        rnd = random.Random(1)
+        for name in ("download_all", "download_bin"):
+            if name == "download_all":
+                urls = ["/" + f.full_file_path.lstrip("/") for f in manifest.files]
+            else:
+                urls = ["/{}/packages/files/{}".format(RELEASE_PATH, containing_file) for containing_file in manifest.files_by_containing_file]
+            state.fail_paths = set(url for url in urls if rnd.random() < args.fail_rate)
+            state.requests = state.ranges = state.failures = state.bytes_sent = state.max_active = 0
+
+            out_dir = os.path.join(root, name)
+            started = time.monotonic()
+            if name == "download_all":
+                progress = manifest.download_all(base_url, out_dir=out_dir, workers=args.workers, per_host=args.per_host)
+            else:
+                progress = manifest.download_bin(out_dir=out_dir, gap=args.gap, workers=args.workers, per_host=args.per_host)
+            elapsed = time.monotonic() - started
+
+            bad = check(out_dir, expected, name == "download_all")
+            failed += bad
+            print("{}: {:.2f} s, {}".format(name, elapsed, progress))
+            print("  {} requests ({} ranges, {} injected 503), {} bytes sent, {} at once at most, {} bad files".format(
+                state.requests, state.ranges, state.failures, state.bytes_sent, state.max_active, bad))
+        server.shutdown()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
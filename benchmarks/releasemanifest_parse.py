@@ -0,0 +1,79 @@
+# Times ReleaseManifest parsing, on the manifests given as arguments or on a synthetic one.
+#   python benchmarks/releasemanifest_parse.py [--repeat N] [--files N] [--directories N] [releasemanifest ...]
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lol_parser.releasemanifest import ReleaseManifest
+
+
+# Directories are laid out breadth first, each one holding a run of the files table.
+def synthetic_manifest(files_count, directories_count, seed=0):
+    rnd = random.Random(seed)
+    children = [[] for _ in range(directories_count)]
+    for idx in range(1, directories_count):
+        children[rnd.randrange(idx)].append(idx)
+    order = [0]
+    for directory in order:
+        order.extend(children[directory])
+    position = {directory: idx for idx, directory in enumerate(order)}
+
+    files_per_directory = [0] * directories_count
+    for _ in range(files_count):
+        files_per_directory[rnd.randrange(directories_count)] += 1
+
+    strings = [""]
+    directory_records = []
+    file_records = []
+    for directory in order:
+        files_start_index = len(file_records)
+        for _ in range(files_per_directory[directory]):
+            strings.append("file_{}.dat".format(len(file_records)))
+            file_records.append(struct.pack("<IIQQIIIIHBB", len(strings) - 1, rnd.randint(0, 9), rnd.getrandbits(64), rnd.getrandbits(64), 4, rnd.getrandbits(20), rnd.getrandbits(20), 0, 0, 0, 0))
+        name_index = 0
+        if directory:
+            strings.append("Directory{}".format(directory))
+            name_index = len(strings) - 1
+        sub_directories = children[directory]
+        sub_directories_start_index = position[sub_directories[0]] if sub_directories else 0
+        directory_records.append(struct.pack("<IIIII", name_index, sub_directories_start_index, len(sub_directories), files_start_index, files_per_directory[directory]))
+
+    strings_data = b"".join(string.encode("latin-1") + b"\0" for string in strings)
+    return b"".join([
+        b"RLSM", struct.pack("<II4BI", 1, 0, 42, 1, 0, 0, len(directory_records)), b"".join(directory_records),
+        struct.pack("<I", len(file_records)), b"".join(file_records),
+        struct.pack("<II", len(strings), len(strings_data)), strings_data,
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--files", dest="files_count", type=int, default=50000)
+    parser.add_argument("--directories", type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = list(args.files)
+    if not samples:
+        synthetic = tempfile.NamedTemporaryFile(suffix=".releasemanifest", delete=False)
+        with synthetic:
+            synthetic.write(synthetic_manifest(args.files_count, args.directories))
+        samples.append(synthetic.name)
+
+    try:
+        for path in samples:
+            best = min(timeit.repeat(lambda: ReleaseManifest(path), number=1, repeat=args.repeat))
+            print("{}: {:.1f} ms".format(path, best * 1000))
+    finally:
+        if not args.files:
+            os.remove(samples[0])
+
+
+if __name__ == "__main__":
+    main()
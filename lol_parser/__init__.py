@@ -3,4 +3,6 @@ from .releasemanifest import ReleaseManifest
 from .solutionmanifest import SolutionManifest
 from .version import Version
 from .wadfile import WadFile
+from .wadindex import WadIndex
 from .binfile import BinFile
+from .binbatch import parse_wad_bins
@@ -0,0 +1,120 @@
+import concurrent.futures
+import io
+import json
+import os
+
+from .binfile import BinFile
+from .wadfile import WadFile, WadFileHeader, _make_pool, _worker_wad
+
+# A work unit holds entries until their raw data reaches BATCH_CHUNK_SIZE bytes or
+# BATCH_CHUNK_ENTRIES entries, so that small bins don't cost one round trip each.
+BATCH_CHUNK_SIZE = 8 * 1024 * 1024
+BATCH_CHUNK_ENTRIES = 256
+
+_BIN_MAGICS = (b"PROP", b"PTCH")
+
+
+class BinBatchResult(object):
+    # Only one of bin_file (output "object"), line (output "ndjson") or error is set.
+    def __init__(self, wad_path, hashed_file_name, bin_file=None, line=None, error=None):
+        self.wad_path = wad_path
+        self.hashed_file_name = hashed_file_name
+        self.bin_file = bin_file
+        self.line = line
+        self.error = error
+
+    def __repr__(self):
+        state = "error: {}".format(self.error) if self.error else "ok"
+        return "<BinBatchResult {} in {} ({})>".format(self.hashed_file_name, self.wad_path, state)
+
+
+# Finds the bin entries (PROP/PTCH) of the given WADs (WadFile objects or paths) and parses them on
+# a pool ("process" or "thread"), yielding a BinBatchResult per bin as they are done, in no
+# particular order. With output "ndjson" results carry a JSON line of the (translated, if asked)
+# entries instead of the BinFile. With cache (a BinFileCache), bins unchanged since a previous run
+# are loaded from it instead of being parsed again.
+def parse_wad_bins(wads, workers=None, executor="process", output="object", translate=False, chunk_size=BATCH_CHUNK_SIZE, chunk_entries=BATCH_CHUNK_ENTRIES, cache=None):
+    if output not in ("object", "ndjson"):
+        raise ValueError("Unknown output '{}', expected 'object' or 'ndjson'.".format(output))
+
+    # Thread workers share the archives opened here (mapped once per call, closed at the end), pool
+    # processes are given the path and map the archive themselves.
+    workers = workers or os.cpu_count() or 1
+    in_thread = executor == "thread"
+    opened = []
+    try:
+        with _make_pool(workers, executor) as pool:
+            pending = set()
+            for wad, entries in _chunks(wads, chunk_size, chunk_entries, in_thread, opened):
+                if len(pending) >= workers * 2:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        for result in future.result():
+                            yield result
+                pending.add(pool.submit(_parse_chunk, wad if in_thread else wad.path, entries, output, translate, cache))
+
+            for future in concurrent.futures.as_completed(pending):
+                for result in future.result():
+                    yield result
+    finally:
+        for wad in opened:
+            wad.close()
+
+
+def _chunks(wads, chunk_size, chunk_entries, use_mmap, opened):
+    for wad in wads:
+        if not isinstance(wad, WadFile):
+            wad = WadFile(wad, use_mmap=use_mmap)
+            opened.append(wad)
+
+        chunk, chunk_bytes = [], 0
+        for entry in sorted(wad.file_headers.entries(), key=lambda e: e[1]):
+            path_hash, offset, compressed_file_size, file_size, compressed = entry[:5]
+            if compressed == 2 or file_size < 8: # Redirections, and too small to be a bin
+                continue
+
+            chunk.append((path_hash, offset, compressed_file_size, file_size, compressed))
+            chunk_bytes += compressed_file_size if compressed else file_size
+            if chunk_bytes >= chunk_size or len(chunk) >= chunk_entries:
+                yield wad, chunk
+                chunk, chunk_bytes = [], 0
+        if chunk:
+            yield wad, chunk
+
+
+# Pool processes keep one BinFileCache per cache directory, as it tracks the size of the cache.
+_worker_caches = {}
+
+
+# wad is the WadFile for thread workers, its path in pool processes.
+def _parse_chunk(wad, entries, output, translate, cache):
+    results = []
+    if not isinstance(wad, WadFile):
+        wad = _worker_wad(wad)
+        if cache is not None:
+            cache = _worker_caches.setdefault((cache.directory, cache.max_bytes), cache)
+    wad_path = wad.path
+    with wad.open() as buff:
+        for path_hash, offset, compressed_file_size, file_size, compressed in entries:
+            hashed_file_name = "{:016x}".format(path_hash)
+            file_header = WadFileHeader(hashed_file_name, offset, compressed_file_size, file_size, compressed, {})
+
+            # Only the start of the entry is decompressed to look for the magic
+            magic = next(file_header.stream(buff, 4096), b"")[0:4]
+            if bytes(magic) not in _BIN_MAGICS:
+                continue
+
+            try:
+                bin_file = BinFile(buffer=bytes(file_header.data(buff)), cache=cache)
+                if output == "object":
+                    results.append(BinBatchResult(wad_path, hashed_file_name, bin_file=bin_file))
+                else:
+                    line = io.StringIO()
+                    line.write('{{"wad": {}, "file": "{}", "entries": '.format(json.dumps(wad_path), hashed_file_name))
+                    bin_file.dump_json(line, translate=translate)
+                    line.write("}")
+                    results.append(BinBatchResult(wad_path, hashed_file_name, line=line.getvalue()))
+            except Exception as e:
+                results.append(BinBatchResult(wad_path, hashed_file_name, error="{}: {}".format(type(e).__name__, e)))
+    return results
+
@@ -1,12 +1,398 @@
+import array
+import bisect
+import collections.abc
+import heapq
 import io
+import itertools
 import os
+import pickle
 import struct
+import sys
+import threading
+import xxhash
 from enum import Enum
 import json
 
-with io.open(os.path.join(os.path.dirname(__file__), "binfile.hashes.txt")) as hashes_file:
-    hashes = (l.strip().split(' ', 1) for l in hashes_file)
-    binfile_hashes = {str(int(h, 16)): s for h, s in hashes}
+BINFILE_HASHES_PATH = os.path.join(os.path.dirname(__file__), "binfile.hashes.txt")
+# Compiled form of BINFILE_HASHES_PATH (see BinFileHashes.save()), used instead of it when present and newer.
+BINFILE_HASHES_COMPILED_PATH = os.path.join(os.path.dirname(__file__), "binfile.hashes.bin")
+
+_HASHES_MAGIC = b"BHSH"
+_hashes_header = struct.Struct("<4sII")
+
+# Bump when the parsed output of BinFile changes, BinFileCache entries of other versions are ignored.
+BINFILE_PARSER_VERSION = 1
+BINFILE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+BINFILE_CACHE_RESCAN_FRACTION = 16
+
+_CACHE_MAGIC = b"BPCK"
+_cache_header = struct.Struct("<4sI")
+
+
+# Hash -> name table, loaded from its sources on first use. Names are kept in a single utf-8 blob
+# indexed by a sorted array of hashes, searched on the first lookup of a key. The result (the name,
+# or None) is then kept in a dict of the table, so later lookups are a single dict probe and return
+# the same str object. The three tables, their stamp and that dict are swapped as a single tuple,
+# so lookups running during a merge see either the old or the new one.
+class BinFileHashes(object):
+    def __init__(self, *paths):
+        self._sources = list(paths)
+        self._table = None
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._loaded()[0])
+
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+    def __getitem__(self, key):
+        name = self.get(key)
+        if name is None:
+            raise KeyError(key)
+        return name
+
+
+    def __iter__(self):
+        return iter(self._loaded()[0])
+
+
+    def items(self):
+        table = self._loaded()
+        for idx, h in enumerate(table[0]):
+            yield h, _table_name(table, idx)
+
+
+    # key is the hash, its decimal string form is accepted too.
+    def get(self, key, default=None):
+        if key.__class__ not in _NAME_KEY_TYPES: # bool and float keys would match ints
+            return default
+        name = (self._table or self._loaded())[4][key]
+        return default if name is None else name
+
+
+    # The hash (or decimal string) -> name (or None) dict of the current table, for the parser and
+    # translate() to probe directly. Only int and str keys.
+    def _names(self):
+        table = self._table
+        if table is None:
+            table = self._loaded()
+        return table[4]
+
+
+    def _loaded(self):
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    table = (array.array("I"), array.array("I", [0]), b"")
+                    for path in self._sources:
+                        table = _merge_tables(table, _read_hashes(path))
+                    self._table = _stamped(table)
+        return self._table
+
+
+    # Checksum of the table, changes whenever names are added or replaced (see BinFileCache.key()).
+    def stamp(self):
+        return self._loaded()[3]
+
+
+    # Adds the hashes of a text ("<hex hash> <name>" lines) or compiled file, replacing known names.
+    def merge_file(self, path):
+        self._loaded()
+        with self._lock:
+            self._table = _stamped(_merge_tables(self._table, _read_hashes(path)))
+
+
+    def merge(self, pairs):
+        hashes, offsets, names = array.array("I"), array.array("I", [0]), bytearray()
+        for h, name in pairs:
+            hashes.append(h)
+            names += name.encode("utf-8")
+            offsets.append(len(names))
+
+        self._loaded()
+        with self._lock:
+            self._table = _stamped(_merge_tables(self._table, (hashes, offsets, names)))
+
+
+    # Writes the compiled form: header, sorted u32 hashes, u32 name offsets and the names blob.
+    def save(self, path):
+        table_hashes, table_offsets, table_names = self._loaded()[:3]
+        hashes, offsets = array.array("I", table_hashes), array.array("I", table_offsets)
+        if sys.byteorder != "little":
+            hashes.byteswap()
+            offsets.byteswap()
+
+        with io.open(path, "wb") as hashes_file:
+            hashes_file.write(_hashes_header.pack(_HASHES_MAGIC, len(hashes), len(table_names)))
+            hashes_file.write(hashes.tobytes())
+            hashes_file.write(offsets.tobytes())
+            hashes_file.write(table_names)
+
+
+def _int_hash_key(key):
+    if not isinstance(key, str):
+        return None
+    try:
+        int_key = int(key)
+    except ValueError:
+        return None
+    return int_key if str(int_key) == key else None
+
+
+def _is_strictly_sorted(values):
+    return all(a < b for a, b in zip(values, values[1:]))
+
+
+def _table_name(table, idx):
+    offsets, names = table[1], table[2]
+    return names[offsets[idx]:offsets[idx+1]].decode("utf-8")
+
+
+_NAME_KEY_TYPES = frozenset((int, str))
+_TRANSLATE_LEAF_TYPES = frozenset((int, str, float, bool, type(None)))
+
+
+# Filled with the result of a search in the table on the first lookup of each key.
+class _HashNames(dict):
+    __slots__ = ("_table",)
+
+    def __init__(self, table):
+        self._table = table
+
+    def __missing__(self, key):
+        name = self[key] = _search_name(self._table, key)
+        return name
+
+
+def _search_name(table, key):
+    if type(key) is not int:
+        key = _int_hash_key(key)
+        if key is None:
+            return None
+    hashes = table[0]
+    idx = bisect.bisect_left(hashes, key)
+    if idx < len(hashes) and hashes[idx] == key:
+        return _table_name(table, idx)
+    return None
+
+
+def _stamped(table):
+    hashes, offsets, names = table
+    stamp = xxhash.xxh3_64()
+    for part in (hashes, offsets, names):
+        stamp.update(part)
+    return hashes, offsets, names, stamp.intdigest(), _HashNames(table)
+
+
+_MERGE_RUN_SIZE = 65536
+
+
+# Merges the (hashes, offsets, names) table other into table, the last name of every hash wins.
+# Only other is sorted, in runs of _MERGE_RUN_SIZE packed (hash << 32 | index) keys, and the runs
+# are merged lazily with the already sorted table, so no per entry objects are kept around.
+def _merge_tables(table, other):
+    hashes, offsets, names = other
+    if not len(table[0]) and _is_strictly_sorted(hashes):
+        return other
+
+    runs = []
+    for start in range(0, len(hashes), _MERGE_RUN_SIZE):
+        run_hashes = hashes[start:start + _MERGE_RUN_SIZE]
+        runs.append(array.array("Q", sorted((h << 32) | (start + idx) for idx, h in enumerate(run_hashes))))
+
+    # Keys are (hash << 33 | source << 32 | index): on a tie the entries of table come first, then
+    # those of other in their order.
+    tables = (table[:3], other)
+    merged = heapq.merge(
+        ((h << 33) | idx for idx, h in enumerate(table[0])),
+        *(((key >> 32 << 33) | (1 << 32) | (key & 0xffffffff) for key in run) for run in runs)
+    )
+
+    merged_hashes, merged_offsets, merged_names = array.array("I"), array.array("I", [0]), bytearray()
+    last = None
+    for key in itertools.chain(merged, (None,)):
+        if last is not None and (key is None or key >> 33 != last >> 33):
+            table_hashes, table_offsets, table_names = tables[(last >> 32) & 1]
+            idx = last & 0xffffffff
+            merged_hashes.append(last >> 33)
+            merged_names += table_names[table_offsets[idx]:table_offsets[idx+1]]
+            merged_offsets.append(len(merged_names))
+        last = key
+    return merged_hashes, merged_offsets, merged_names
+
+
+# Returns the (hashes, offsets, names) table of a text or compiled hashes file, read as it goes.
+def _read_hashes(path):
+    hashes, offsets = array.array("I"), array.array("I", [0])
+    with io.open(path, "rb") as hashes_file:
+        header = hashes_file.read(_hashes_header.size)
+        if header[0:4] == _HASHES_MAGIC:
+            magic, count, names_size = _hashes_header.unpack(header)
+            hashes.fromfile(hashes_file, count)
+            offsets = array.array("I")
+            offsets.fromfile(hashes_file, count + 1)
+            if sys.byteorder != "little":
+                hashes.byteswap()
+                offsets.byteswap()
+            return hashes, offsets, hashes_file.read(names_size)
+
+        hashes_file.seek(0)
+        names = bytearray()
+        for line in hashes_file:
+            line = line.strip()
+            if not line:
+                continue
+            h, name = line.split(b" ", 1)
+            hashes.append(int(h, 16))
+            names += name
+            offsets.append(len(names))
+    return hashes, offsets, names
+
+
+def _default_hashes_source():
+    if os.path.exists(BINFILE_HASHES_COMPILED_PATH) and os.path.getmtime(BINFILE_HASHES_COMPILED_PATH) >= os.path.getmtime(BINFILE_HASHES_PATH):
+        return BINFILE_HASHES_COMPILED_PATH
+    return BINFILE_HASHES_PATH
+
+
+binfile_hashes = BinFileHashes(_default_hashes_source())
+
+
+# On disk cache of parsed bins, keyed by the hash of the bin data, the parsing options and the stamp
+# of binfile_hashes, as HASH values are stored translated. Entries are pickled, the least recently
+# used are removed once the cache grows over max_bytes. Several instances (pool processes) can
+# share a directory: each one rescans it after writing max_bytes / BINFILE_CACHE_RESCAN_FRACTION
+# bytes, and before evicting, so the directory stays within a fraction of max_bytes per writer.
+class BinFileCache(object):
+    def __init__(self, directory, max_bytes=BINFILE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sizes = None
+        self._size = 0
+        self._unscanned = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    # Pool workers get their own instance on the same directory.
+    def __reduce__(self):
+        return (BinFileCache, (self.directory, self.max_bytes))
+
+
+    def __repr__(self):
+        return "<BinFileCache {}, {} hits, {} misses, {} evictions>".format(self.directory, self.hits, self.misses, self.evictions)
+
+
+    @staticmethod
+    def key(data, numeric_arrays=None, compact=False):
+        return "{}-{}-{:016x}{}".format(xxhash.xxh3_128_hexdigest(data), numeric_arrays or "list", binfile_hashes.stamp(), "-compact" if compact else "")
+
+
+    def get(self, key):
+        path = os.path.join(self.directory, key)
+        try:
+            with io.open(path, "rb") as cache_file:
+                data = cache_file.read()
+        except FileNotFoundError:
+            self._count_miss()
+            return None
+
+        state = None
+        if len(data) >= _cache_header.size and _cache_header.unpack_from(data, 0) == (_CACHE_MAGIC, BINFILE_PARSER_VERSION):
+            try:
+                state = pickle.loads(data[_cache_header.size:])
+            except Exception as e:
+                print("WARNING: Discarding the cached bin {}: {}".format(path, e))
+        if state is None:
+            self._remove(key)
+            self._count_miss()
+            return None
+
+        try:
+            os.utime(path) # Marks it as recently used
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return state
+
+
+    def put(self, key, state):
+        data = _cache_header.pack(_CACHE_MAGIC, BINFILE_PARSER_VERSION) + pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+
+        path = os.path.join(self.directory, key)
+        tmp_path = "{}.{}-{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with io.open(tmp_path, "wb") as cache_file:
+            cache_file.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._unscanned += len(data)
+            if self._sizes is None or self._size + self._unscanned > self.max_bytes or self._unscanned >= self.max_bytes // BINFILE_CACHE_RESCAN_FRACTION:
+                self._scan()
+                if self._size > self.max_bytes:
+                    self._evict()
+
+
+    def clear(self):
+        with self._lock:
+            for key in os.listdir(self.directory):
+                self._remove(key)
+            self._sizes = None
+            self._size = 0
+            self._unscanned = 0
+
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+
+    def _remove(self, key):
+        try:
+            os.remove(os.path.join(self.directory, key))
+        except FileNotFoundError:
+            pass
+
+
+    # Sizes of the entries currently in the directory, whoever wrote them.
+    def _scan(self):
+        self._sizes = {}
+        for dir_entry in os.scandir(self.directory):
+            try:
+                if dir_entry.is_file() and not dir_entry.name.endswith(".tmp"):
+                    self._sizes[dir_entry.name] = dir_entry.stat().st_size
+            except FileNotFoundError: # Removed by another process
+                pass
+        self._size = sum(self._sizes.values())
+        self._unscanned = 0
+
+
+    # Removes the least recently used entries down to 3/4 of max_bytes, so evictions are batched.
+    def _evict(self):
+        entries = []
+        for key, size in list(self._sizes.items()):
+            try:
+                entries.append((os.stat(os.path.join(self.directory, key)).st_mtime_ns, key))
+            except FileNotFoundError: # Removed by another process
+                self._size -= self._sizes.pop(key)
+        entries.sort()
+
+        for _, key in entries:
+            if self._size <= self.max_bytes * 3 // 4:
+                break
+            self._remove(key)
+            self._size -= self._sizes.pop(key)
+            self.evictions += 1
 
 
 class BinFileFieldHashType(Enum):
@@ -39,215 +425,964 @@ class BinFileFieldHashType(Enum):
 
 # Bin files are pretty much a structured json file
 class BinFile(object):
-    def __init__(self, file_path=None, buffer=None):
+    # buffer can be a file object or the bin data itself (bytes, bytearray or memoryview).
+    # With lazy, entries (and the STRUCT/EMBEDDED fields inside them) are BinLazyStruct mappings
+    # that are only decoded when accessed, parsing just skips over them using their data size.
+    # With numeric_arrays ("array" or "numpy"), FIELD_LIST/ARRAY of numeric types are decoded at
+    # once into a BinArray or a numpy array instead of a list of values/tuples.
+    # With compact, entries and STRUCT/EMBEDDED/MAP fields are BinStruct, BinEmbedded and BinMap
+    # nodes, read-only mappings that keep their fields in parallel arrays instead of a dict.
+    # With cache (a BinFileCache), bins parsed before with the same options are loaded from it.
+    # Lazy parsing doesn't use the cache, as its structs are decoded from the bin data.
+    def __init__(self, file_path=None, buffer=None, lazy=False, numeric_arrays=None, cache=None, compact=False):
         self._buffer = buffer
         self.path = file_path
         self.version = 0
         self.associated_files = []
         self.entries = {}
+        self.entries_by_hash = {}
+        self.lazy = lazy
+        self.numeric_arrays = numeric_arrays
+        self.compact = compact
+        self.patch = False
 
         if self.path != None:
-            self._buffer = io.open(self.path, "rb")
-
-        self._load_headers()
+            with io.open(self.path, "rb") as bin_file:
+                data = bin_file.read()
+        elif isinstance(self._buffer, (bytes, bytearray, memoryview)):
+            data = self._buffer
+        else:
+            data = self._buffer.read()
+        self._buffer = None
 
-        if self.path != None:
-            self._buffer.close()
+        parsers = _field_parsers(lazy, numeric_arrays, compact)
+        if cache is None or lazy:
+            self._load_headers(_BinFileReader(data, parsers=parsers))
+            return
 
+        key = BinFileCache.key(data, numeric_arrays, compact)
+        state = cache.get(key)
+        if state is not None:
+            self.version, self.patch, self.associated_files, self.entries = state
+            for strcts in self.entries.values():
+                for strct in strcts:
+                    self.entries_by_hash[strct["_hash"]] = strct
+            return
 
-    def _read(self, byte_format):
-        byte_length = struct.calcsize(byte_format)
-        return struct.unpack(byte_format, self._buffer.read(byte_length))
+        self._load_headers(_BinFileReader(data, parsers=parsers))
+        cache.put(key, (self.version, self.patch, self.associated_files, self.entries))
 
 
-    def _load_headers(self):
-            magic = self._buffer.read(4)
+    # Patch bins (PTCH) wrap a regular PROP bin, the patches that follow its entries are not parsed.
+    def _load_headers(self, reader):
+            magic = reader.read_bytes(4)
+            if magic == b"PTCH":
+                self.patch = True
+                reader.position += 8
+                magic = reader.read_bytes(4)
             if magic != b"PROP":
                 raise NotImplementedError("A parser for Bin with magic '{}' is not implemented.".format(magic))
 
-            version = self._read("<I")[0]
+            version = reader.read_uint32()
 
-            if version not in [1, 2]:
+            if version not in [1, 2, 3]:
                 raise NotImplementedError("A parser for Bin version {} is not implemented.".format(version))
-            
-            if version == 2:
-                self._parse_associated_files()
+            self.version = version
 
-            self._parse_v1()
-        
+            if version >= 2:
+                self._parse_associated_files(reader)
 
-    def _parse_associated_files(self):
-        strings_count = self._read("<I")[0]
+            self._parse_v1(reader)
+
+
+    def _parse_associated_files(self, reader):
+        strings_count = reader.read_uint32()
         for _ in range(strings_count):
-            string = self._parseField(BinFileFieldHashType.STRING)
+            string = reader.parse_field(BinFileFieldHashType.STRING.value)
             self.associated_files.append(string)
 
 
-    def _parse_v1(self):
-        entries_count = self._read("<I")[0]
-        entries_types = []
-        
-        for _ in range(entries_count):
-            entry_type = self._read("<I")[0]
-            entries_types.append(entry_type)
-        
+    def _parse_v1(self, reader):
+        entries_count = reader.read_uint32()
+        entries_types = reader.read_uint32_array(entries_count)
+
+        parse_entry = _entry_parser(self.lazy, self.compact)
         for entry_type in entries_types:
-            strct = self._parseField(BinFileFieldHashType.STRUCT)
-            strct["_hash"], strct["_data_size"] = strct["_data_size"], strct["_hash"]
+            strct = parse_entry(reader)
             if entry_type not in self.entries:
                 self.entries[entry_type] = []
             self.entries[entry_type].append(strct)
-    
+            self.entries_by_hash[strct["_hash"]] = strct
 
-    def _parseFieldHeader(self):
-        # Hash, Type
-        return self._read("<IB")
-
-
-    def _parseField(self, field_type):
-        if isinstance(field_type, int):
-            field_type = BinFileFieldHashType(field_type)
-        
-        if field_type == BinFileFieldHashType.VECTOR3_UINT8:
-            return self._read("<3H")
-
-        elif field_type == BinFileFieldHashType.BOOL:
-            return self._read("<?")[0]
-
-        elif field_type == BinFileFieldHashType.INT8:
-            return self._read("<b")[0]
-
-        elif field_type == BinFileFieldHashType.UINT8:
-            return self._read("<B")[0]
-
-        elif field_type == BinFileFieldHashType.INT16:
-            return self._read("<h")[0]
-
-        elif field_type == BinFileFieldHashType.UINT16:
-            return self._read("<H")[0]
-
-        elif field_type == BinFileFieldHashType.INT32:
-            return self._read("<i")[0]
-
-        elif field_type == BinFileFieldHashType.UINT32:
-            return self._read("<I")[0]
-
-        elif field_type == BinFileFieldHashType.INT64:
-            return self._read("<q")[0]
-
-        elif field_type == BinFileFieldHashType.UINT64:
-            return self._read("<Q")[0]
-
-        elif field_type == BinFileFieldHashType.FLOAT:
-            return self._read("<f")[0]
-
-        elif field_type == BinFileFieldHashType.VECTOR2_FLOAT:
-            return self._read("<2f")
-
-        elif field_type == BinFileFieldHashType.VECTOR3_FLOAT:
-            return self._read("<3f")
-
-        elif field_type == BinFileFieldHashType.VECTOR4_FLOAT:
-            return self._read("<4f")
-
-        elif field_type == BinFileFieldHashType.MATRIX_4X4:
-            return self._read("<16f")
-
-        elif field_type == BinFileFieldHashType.RGBA:
-            return self._read("<4B")
-
-        elif field_type == BinFileFieldHashType.STRING:
-            string_length = self._read("<H")[0]
-            return self._buffer.read(string_length).decode('utf-8')
-
-        elif field_type == BinFileFieldHashType.HASH:
-            hashed_val = str(self._read("<I")[0])
-            return binfile_hashes.get(hashed_val, hashed_val)
-
-        elif field_type == BinFileFieldHashType.FIELD_LIST:
-            container_field_type, unknown, container_size = self._read("<BII")
-            lst = []
-            for _ in range(container_size):
-                lst.append(self._parseField(container_field_type))
-            return lst
-
-        elif field_type == BinFileFieldHashType.STRUCT:
-            struct_hash = self._read("<I")[0]
-            data_size, struct_entries_count = self._read("<IH")
-            strct = {"_hash": struct_hash, "_data_size": data_size, "_type": 0}
-
-            for _ in range(struct_entries_count):
-                key, entry_type = self._parseFieldHeader()
-                if key in strct:
-                    print("WARNING: Replacing key {} in the struct field.".format(key))
-                strct[key] = self._parseField(entry_type)
-            return strct
-        
-        elif field_type == BinFileFieldHashType.EMBEDDED:
-            struct_hash = self._read("<I")[0]
-            data_size, entries_count = self._read("<IH")
-            strct = {"_hash": struct_hash, "_data_size": data_size, "_type": 1}
-
-            for _ in range(entries_count):
-                key, entry_type = self._parseFieldHeader()
-                if key in strct:
-                    print("WARNING: Replacing key {} in the embedded field.".format(key))
-                strct[key] = self._parseField(entry_type)
-            return strct
-        
-        elif field_type == BinFileFieldHashType.HASH_LINK:
-            return self._read("<L")[0]
-
-        elif field_type == BinFileFieldHashType.ARRAY:
-            array_element_type, array_size = self._read("<BB")
-            lst = []
-            for _ in range(array_size):
-                lst.append(self._parseField(array_element_type))
-            return lst
-
-        elif field_type == BinFileFieldHashType.MAP:
-            key_type, value_type, unknown, map_size = self._read("<BBLL")
-            strct = {}
-            for _ in range(map_size):
-                key = self._parseField(key_type)
-                value = self._parseField(value_type)
-                if key in strct:
-                    print("WARNING: Replacing key {} in the map.".format(key))
-                strct[key] = value
-            return strct
-
-        elif field_type == BinFileFieldHashType.PADDING:
-            return self._read("<B")[0]
 
-        else:
-            raise NotImplementedError("A parser for a BinFileField with type '{}' is not implemented.".format(field_type))
+    # Returns the entry with the given hash or name.
+    def entry(self, key):
+        if isinstance(key, str):
+            key = BinFile.hash(key)
+        return self.entries_by_hash[key]
+
+
+    # Yields (entry_type, entry_hash, entry) one entry at a time, reading the bin as it goes instead
+    # of building self.entries. With types (entry types as hashes or class names), other entries
+    # are skipped using their data size without being decoded.
+    @staticmethod
+    def iter_entries(file_path=None, buffer=None, types=None, lazy=False, numeric_arrays=None, compact=False):
+        if file_path != None:
+            with io.open(file_path, "rb") as bin_file:
+                for item in BinFile.iter_entries(buffer=bin_file, types=types, lazy=lazy, numeric_arrays=numeric_arrays, compact=compact):
+                    yield item
+            return
+        if isinstance(buffer, (bytes, bytearray, memoryview)):
+            buffer = io.BytesIO(buffer)
+
+        if types is not None:
+            types = set(BinFile.hash(t) if isinstance(t, str) else t for t in types)
+        parsers = _field_parsers(lazy, numeric_arrays, compact)
+        parse_entry = _entry_parser(lazy, compact)
+
+        magic = _read_exact(buffer, 4)
+        if magic == b"PTCH":
+            _skip(buffer, 8)
+            magic = _read_exact(buffer, 4)
+        if magic != b"PROP":
+            raise NotImplementedError("A parser for Bin with magic '{}' is not implemented.".format(magic))
+        version = _uint32.unpack(_read_exact(buffer, 4))[0]
+        if version not in [1, 2, 3]:
+            raise NotImplementedError("A parser for Bin version {} is not implemented.".format(version))
+
+        if version >= 2:
+            strings_count = _uint32.unpack(_read_exact(buffer, 4))[0]
+            for _ in range(strings_count):
+                string_length = _uint16.unpack(_read_exact(buffer, 2))[0]
+                _skip(buffer, string_length)
+
+        entries_count = _uint32.unpack(_read_exact(buffer, 4))[0]
+        entries_types = struct.unpack("<{}I".format(entries_count), _read_exact(buffer, entries_count * 4))
+
+        for entry_type in entries_types:
+            size_data = _read_exact(buffer, 4)
+            data_size = _uint32.unpack(size_data)[0]
+            if types is not None and entry_type not in types:
+                _skip(buffer, data_size)
+                continue
+
+            strct = parse_entry(_BinFileReader(size_data + _read_exact(buffer, data_size), parsers=parsers))
+            yield entry_type, strct["_hash"], strct
+
 
-    
     # Translate all known "keys hashes" to strings, returns the hash when unknown
     def translate(self):
         return BinFile._translateEntry(self.entries)
 
 
     @staticmethod
-    def _translateEntry(entry):
-        if isinstance(entry, dict):
+    def _translateEntry(entry, names=None):
+        if names is None:
+            names = binfile_hashes._names()
+        if entry.__class__ in _TRANSLATE_LEAF_TYPES: # Skips the slower Mapping check for plain values
+            return entry
+        elif entry.__class__ is dict or isinstance(entry, collections.abc.Mapping):
             tmp = {}
             for k, v in entry.items():
-                new_key = binfile_hashes.get(str(k), k)
-                tmp[new_key] = BinFile._translateEntry(v)
+                new_key = names[k] if k.__class__ in _NAME_KEY_TYPES else None
+                tmp[k if new_key is None else new_key] = BinFile._translateEntry(v, names)
             return tmp
         elif isinstance(entry, list):
             tmp = []
             for v in entry:
-                tmp.append(BinFile._translateEntry(v))
+                tmp.append(BinFile._translateEntry(v, names))
             return tmp
         else:
             return entry
 
 
+    # Writes the entries as JSON to stream (a text file object) one entry at a time, translating the
+    # keys on the fly like translate() does instead of building a translated copy first. Keys json
+    # can't represent (vectors used as MAP keys) are written as their string form.
+    def dump_json(self, stream, translate=True):
+        stream.write("{")
+        for type_idx, (entry_type, strcts) in enumerate(self.entries.items()):
+            stream.write("{}{}: [".format(", " if type_idx else "", _json_key(entry_type, translate)))
+            for idx, strct in enumerate(strcts):
+                pieces = [", "] if idx else []
+                _json_pieces(strct, translate, pieces)
+                stream.write("".join(pieces))
+            stream.write("]")
+        stream.write("}")
+
+
+    # Same as dump_json, as one {"type": ..., "entry": {...}} object per line and per entry.
+    def dump_ndjson(self, stream, translate=True):
+        for entry_type, strcts in self.entries.items():
+            for strct in strcts:
+                _write_ndjson_entry(stream, entry_type, strct, translate)
+
+
+    # dump_ndjson straight from a bin file or buffer (see iter_entries), entries are decoded one at
+    # a time and dropped once written.
+    @staticmethod
+    def stream_ndjson(stream, file_path=None, buffer=None, types=None, translate=True):
+        for entry_type, entry_hash, strct in BinFile.iter_entries(file_path=file_path, buffer=buffer, types=types, lazy=True):
+            _write_ndjson_entry(stream, entry_type, strct, translate)
+
+
     @staticmethod
     def hash(s):
         h = 0x811c9dc5
         for b in s.encode('ascii').lower():
             h = ((h ^ b) * 0x01000193) % 0x100000000
         return h
+
+
+    # Same as hash() for many strings at once, returns an array('I') in the same order. With numpy
+    # the strings are hashed together one character position at a time, in chunks of chunk_size.
+    @staticmethod
+    def hash_many(strings, chunk_size=65536):
+        hashes = array.array("I")
+        strings = iter(strings)
+        while True:
+            chunk = [s.encode('ascii').lower() for s in itertools.islice(strings, chunk_size)]
+            if not chunk:
+                return hashes
+            hashes.extend(_fnv1a_many(chunk))
+
+
+_encode_json_string = json.encoder.encode_basestring_ascii
+
+
+def _fnv1a_many(encoded):
+    try:
+        import numpy
+    except ImportError:
+        return [_fnv1a(data) for data in encoded]
+
+    count = len(encoded)
+    lengths = numpy.fromiter(map(len, encoded), dtype=numpy.int64, count=count)
+    # Longest strings first, so the strings still being hashed at a position are a prefix of the rows
+    order = numpy.argsort(-lengths, kind="stable")
+    lengths = lengths[order]
+    width = int(lengths[0]) if count else 0
+
+    chars = numpy.zeros((count, width), dtype=numpy.uint8)
+    flat = numpy.frombuffer(b"".join(encoded[idx] for idx in order.tolist()), dtype=numpy.uint8)
+    rows = numpy.repeat(numpy.arange(count), lengths)
+    starts = numpy.cumsum(lengths) - lengths
+    chars[rows, numpy.arange(len(flat)) - numpy.repeat(starts, lengths)] = flat
+
+    hashes = numpy.full(count, 0x811c9dc5, dtype=numpy.uint32)
+    # Number of strings longer than each position
+    rows_counts = numpy.searchsorted(-lengths, -numpy.arange(width), side="left").tolist()
+    for position, rows_count in enumerate(rows_counts):
+        head = hashes[:rows_count]
+        head ^= chars[:rows_count, position]
+        head *= numpy.uint32(0x01000193)
+
+    result = numpy.empty(count, dtype=numpy.uint32)
+    result[order] = hashes
+    return result.tolist()
+
+
+def _fnv1a(data):
+    h = 0x811c9dc5
+    for b in data:
+        h = ((h ^ b) * 0x01000193) & 0xffffffff
+    return h
+
+
+def _write_ndjson_entry(stream, entry_type, strct, translate):
+    pieces = ['{"type": ', _json_key(entry_type, translate), ', "entry": ']
+    _json_pieces(strct, translate, pieces)
+    pieces.append("}\n")
+    stream.write("".join(pieces))
+
+
+# Same output as json.dumps for what it accepts, the key is translated first when asked.
+def _json_key(key, translate):
+    if translate:
+        key = binfile_hashes.get(key, key)
+    if isinstance(key, str):
+        return _encode_json_string(key)
+    elif key is None or isinstance(key, bool):
+        return '"{}"'.format(json.dumps(key))
+    elif isinstance(key, int):
+        return '"{}"'.format(int.__repr__(key))
+    elif isinstance(key, float):
+        return '"{}"'.format(_json_float(key))
+    return _encode_json_string(str(key))
+
+
+def _json_float(value):
+    if value != value:
+        return "NaN"
+    elif value == float("inf"):
+        return "Infinity"
+    elif value == float("-inf"):
+        return "-Infinity"
+    return float.__repr__(value)
+
+
+# Appends the JSON text of value to pieces. Lazy structs that were not accessed yet are decoded
+# for the occasion only, numeric containers (BinArray, numpy) are written as lists.
+def _json_pieces(value, translate, pieces):
+    if isinstance(value, str):
+        pieces.append(_encode_json_string(value))
+    elif value is None:
+        pieces.append("null")
+    elif value is True:
+        pieces.append("true")
+    elif value is False:
+        pieces.append("false")
+    elif isinstance(value, int):
+        pieces.append(int.__repr__(value))
+    elif isinstance(value, float):
+        pieces.append(_json_float(value))
+    elif isinstance(value, collections.abc.Mapping):
+        if isinstance(value, BinLazyStruct):
+            value = value._fields if value._fields is not None else value._parse()
+        pieces.append("{")
+        first = True
+        for k, v in value.items():
+            pieces.append(_json_key(k, translate) + ": " if first else ", " + _json_key(k, translate) + ": ")
+            first = False
+            _json_pieces(v, translate, pieces)
+        pieces.append("}")
+    elif isinstance(value, (list, tuple)):
+        pieces.append("[")
+        first = True
+        for v in value:
+            if not first:
+                pieces.append(", ")
+            first = False
+            _json_pieces(v, translate, pieces)
+        pieces.append("]")
+    elif hasattr(value, "tolist"):
+        if getattr(value, "ndim", 0) > 2: # numpy matrices, elements are flat like the parsed tuples
+            value = value.reshape(value.shape[0], value[0].size if len(value) else 0)
+        _json_pieces(value.tolist(), translate, pieces)
+    else:
+        raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+_uint8 = struct.Struct("<B")
+_uint16 = struct.Struct("<H")
+_uint32 = struct.Struct("<I")
+_field_header = struct.Struct("<IB")
+_entry_header = struct.Struct("<IIH")
+_struct_header = struct.Struct("<IIH")
+_field_list_header = struct.Struct("<BII")
+_array_header = struct.Struct("<BB")
+_map_header = struct.Struct("<BBLL")
+
+
+# Parses a bin held in memory, keeping the position as an integer cursor. Fields are decoded by
+# the functions of the parsers table, indexed by the field type.
+class _BinFileReader(object):
+    def __init__(self, data, position=0, parsers=None):
+        self.data = data
+        self.position = position
+        self.parsers = parsers or _FIELD_PARSERS
+        self.hash_names = binfile_hashes._names()
+
+
+    def read_bytes(self, size):
+        position = self.position
+        self.position = position + size
+        return bytes(self.data[position:position+size])
+
+
+    def read_uint32(self):
+        position = self.position
+        self.position = position + 4
+        return _uint32.unpack_from(self.data, position)[0]
+
+
+    def read_uint32_array(self, count):
+        position = self.position
+        self.position = position + count * 4
+        return struct.unpack_from("<{}I".format(count), self.data, position)
+
+
+    def parse_field(self, field_type):
+        return self.parsers[field_type](self)
+
+
+def _read_exact(buff, size):
+    data = buff.read(size)
+    if len(data) != size:
+        raise EOFError("Unexpected end of the bin, expected {} bytes and got {}.".format(size, len(data)))
+    return data
+
+
+def _skip(buff, size):
+    if buff.seekable():
+        buff.seek(size, io.SEEK_CUR)
+    else:
+        _read_exact(buff, size)
+
+
+def _scalar_parser(byte_format, single):
+    unpack_from = struct.Struct(byte_format).unpack_from
+    size = struct.calcsize(byte_format)
+
+    if single:
+        def parse(reader):
+            position = reader.position
+            reader.position = position + size
+            return unpack_from(reader.data, position)[0]
+    else:
+        def parse(reader):
+            position = reader.position
+            reader.position = position + size
+            return unpack_from(reader.data, position)
+    return parse
+
+
+def _parse_string(reader):
+    position = reader.position
+    string_length = _uint16.unpack_from(reader.data, position)[0]
+    position += 2
+    reader.position = position + string_length
+    return str(reader.data[position:position+string_length], "utf-8")
+
+
+def _parse_hash(reader):
+    position = reader.position
+    reader.position = position + 4
+    hashed_val = _uint32.unpack_from(reader.data, position)[0]
+    name = reader.hash_names[hashed_val]
+    return name if name is not None else str(hashed_val)
+
+
+def _parse_field_list(reader):
+    container_field_type, unknown, container_size = _field_list_header.unpack_from(reader.data, reader.position)
+    reader.position += _field_list_header.size
+    parse = reader.parsers[container_field_type]
+    return [parse(reader) for _ in range(container_size)]
+
+
+def _parse_fields(reader, strct, entries_count, field_name):
+    data = reader.data
+    parsers = reader.parsers
+    for _ in range(entries_count):
+        key, entry_type = _field_header.unpack_from(data, reader.position)
+        reader.position += 5
+        if key in strct:
+            print("WARNING: Replacing key {} in the {}.".format(key, field_name))
+        strct[key] = parsers[entry_type](reader)
+    return strct
+
+
+def _parse_struct(reader):
+    struct_hash, data_size, struct_entries_count = _struct_header.unpack_from(reader.data, reader.position)
+    reader.position += _struct_header.size
+    strct = {"_hash": struct_hash, "_data_size": data_size, "_type": 0}
+    return _parse_fields(reader, strct, struct_entries_count, "struct field")
+
+
+def _parse_embedded(reader):
+    struct_hash, data_size, entries_count = _struct_header.unpack_from(reader.data, reader.position)
+    reader.position += _struct_header.size
+    strct = {"_hash": struct_hash, "_data_size": data_size, "_type": 1}
+    return _parse_fields(reader, strct, entries_count, "embedded field")
+
+
+# Top level entries are laid out as data size, hash and fields count (unlike STRUCT fields).
+def _parse_entry(reader):
+    data_size, entry_hash, entries_count = _entry_header.unpack_from(reader.data, reader.position)
+    reader.position += _entry_header.size
+    strct = {"_hash": entry_hash, "_data_size": data_size, "_type": 0}
+    return _parse_fields(reader, strct, entries_count, "struct field")
+
+
+# Decoded on first access, until then only the header values (_hash, _data_size, _type) are known.
+class BinLazyStruct(collections.abc.Mapping):
+    __slots__ = ("_data", "_position", "_parsers", "_entries_count", "_hash", "_data_size", "_type", "_fields")
+
+    def __init__(self, data, position, parsers, struct_hash, data_size, struct_type, entries_count):
+        self._data = data
+        self._position = position
+        self._parsers = parsers
+        self._entries_count = entries_count
+        self._hash = struct_hash
+        self._data_size = data_size
+        self._type = struct_type
+        self._fields = None
+
+
+    def __repr__(self):
+        state = "decoded" if self._fields is not None else "not decoded"
+        return "<BinLazyStruct {} ({} fields, {})>".format(self._hash, self._entries_count, state)
+
+
+    def __len__(self):
+        return len(self._decode())
+
+
+    def __iter__(self):
+        return iter(self._decode())
+
+
+    def __getitem__(self, key):
+        if key == "_hash":
+            return self._hash
+        elif key == "_data_size":
+            return self._data_size
+        elif key == "_type":
+            return self._type
+        return self._decode()[key]
+
+
+    def _decode(self):
+        if self._fields is None:
+            self._fields = self._parse()
+        return self._fields
+
+
+    # Decodes the fields without keeping them.
+    def _parse(self):
+        field_name = "embedded field" if self._type else "struct field"
+        strct = {"_hash": self._hash, "_data_size": self._data_size, "_type": self._type}
+        reader = _BinFileReader(self._data, self._position, self._parsers)
+        return _parse_fields(reader, strct, self._entries_count, field_name)
+
+
+def _parse_lazy_entry(reader):
+    data_size, entry_hash, entries_count = _entry_header.unpack_from(reader.data, reader.position)
+    position = reader.position + _entry_header.size
+    reader.position += 4 + data_size
+    return BinLazyStruct(reader.data, position, reader.parsers, entry_hash, data_size, 0, entries_count)
+
+
+def _lazy_struct_parser(struct_type):
+    def parse(reader):
+        struct_hash, data_size, entries_count = _struct_header.unpack_from(reader.data, reader.position)
+        position = reader.position + _struct_header.size
+        reader.position += 8 + data_size
+        return BinLazyStruct(reader.data, position, reader.parsers, struct_hash, data_size, struct_type, entries_count)
+    return parse
+
+
+# Compact STRUCT (and top level entry) node: the field hashes are kept in an array('I') and the
+# values in a tuple, in the same order. It reads like the dict of the default parsing, including the
+# _hash, _data_size and _type keys, but can't be modified.
+class BinStruct(collections.abc.Mapping):
+    __slots__ = ("class_hash", "data_size", "field_hashes", "field_values")
+    struct_type = 0
+
+    def __init__(self, class_hash, data_size, field_hashes, field_values):
+        self.class_hash = class_hash
+        self.data_size = data_size
+        self.field_hashes = field_hashes
+        self.field_values = field_values
+
+
+    def __repr__(self):
+        return "<{} {} ({} fields)>".format(type(self).__name__, self.class_hash, len(self.field_values))
+
+
+    def __len__(self):
+        return 3 + len(self.field_values)
+
+
+    def __iter__(self):
+        yield "_hash"
+        yield "_data_size"
+        yield "_type"
+        for field_hash in self.field_hashes:
+            yield field_hash
+
+
+    def __contains__(self, key):
+        return key in ("_hash", "_data_size", "_type") or (type(key) is int and key in self.field_hashes)
+
+
+    def __getitem__(self, key):
+        if type(key) is int:
+            try:
+                return self.field_values[self.field_hashes.index(key)]
+            except ValueError:
+                raise KeyError(key)
+        elif key == "_hash":
+            return self.class_hash
+        elif key == "_data_size":
+            return self.data_size
+        elif key == "_type":
+            return self.struct_type
+        raise KeyError(key)
+
+
+    def items(self):
+        return _BinStructItemsView(self)
+
+
+    def values(self):
+        return _BinStructValuesView(self)
+
+
+class BinEmbedded(BinStruct):
+    __slots__ = ()
+    struct_type = 1
+
+
+class _BinStructItemsView(collections.abc.ItemsView):
+    def __iter__(self):
+        node = self._mapping
+        yield ("_hash", node.class_hash)
+        yield ("_data_size", node.data_size)
+        yield ("_type", node.struct_type)
+        for item in zip(node.field_hashes, node.field_values):
+            yield item
+
+
+class _BinStructValuesView(collections.abc.ValuesView):
+    def __iter__(self):
+        node = self._mapping
+        yield node.class_hash
+        yield node.data_size
+        yield node.struct_type
+        for value in node.field_values:
+            yield value
+
+
+# Compact MAP node, keys and values are tuples in the same order. Lookups by key build an index on
+# first use.
+class BinMap(collections.abc.Mapping):
+    __slots__ = ("map_keys", "map_values", "_index")
+
+    def __init__(self, map_keys, map_values):
+        self.map_keys = map_keys
+        self.map_values = map_values
+        self._index = None
+
+
+    def __repr__(self):
+        return "<BinMap ({} items)>".format(len(self.map_keys))
+
+
+    def __len__(self):
+        return len(self.map_keys)
+
+
+    def __iter__(self):
+        return iter(self.map_keys)
+
+
+    def __getitem__(self, key):
+        if self._index is None:
+            self._index = {k: idx for idx, k in enumerate(self.map_keys)}
+        return self.map_values[self._index[key]]
+
+
+    def items(self):
+        return _BinMapItemsView(self)
+
+
+    def values(self):
+        return _BinMapValuesView(self)
+
+
+class _BinMapItemsView(collections.abc.ItemsView):
+    def __iter__(self):
+        return zip(self._mapping.map_keys, self._mapping.map_values)
+
+
+class _BinMapValuesView(collections.abc.ValuesView):
+    def __iter__(self):
+        return iter(self._mapping.map_values)
+
+
+def _parse_compact_fields(reader, entries_count, field_name):
+    data = reader.data
+    parsers = reader.parsers
+    keys = []
+    values = []
+    for _ in range(entries_count):
+        key, entry_type = _field_header.unpack_from(data, reader.position)
+        reader.position += 5
+        keys.append(key)
+        values.append(parsers[entry_type](reader))
+
+    if len(set(keys)) != len(keys):
+        fields = _parse_fields_dedup(keys, values, field_name)
+        keys, values = list(fields), list(fields.values())
+    return array.array("I", keys), tuple(values)
+
+
+# Same as the default parsing, the last value of a repeated key wins where the key first appeared.
+def _parse_fields_dedup(keys, values, field_name):
+    fields = {}
+    for key, value in zip(keys, values):
+        if key in fields:
+            print("WARNING: Replacing key {} in the {}.".format(key, field_name))
+        fields[key] = value
+    return fields
+
+
+def _parse_compact_struct(reader):
+    struct_hash, data_size, struct_entries_count = _struct_header.unpack_from(reader.data, reader.position)
+    reader.position += _struct_header.size
+    return BinStruct(struct_hash, data_size, *_parse_compact_fields(reader, struct_entries_count, "struct field"))
+
+
+def _parse_compact_embedded(reader):
+    struct_hash, data_size, entries_count = _struct_header.unpack_from(reader.data, reader.position)
+    reader.position += _struct_header.size
+    return BinEmbedded(struct_hash, data_size, *_parse_compact_fields(reader, entries_count, "embedded field"))
+
+
+def _parse_compact_entry(reader):
+    data_size, entry_hash, entries_count = _entry_header.unpack_from(reader.data, reader.position)
+    reader.position += _entry_header.size
+    return BinStruct(entry_hash, data_size, *_parse_compact_fields(reader, entries_count, "struct field"))
+
+
+def _parse_compact_map(reader):
+    key_type, value_type, unknown, map_size = _map_header.unpack_from(reader.data, reader.position)
+    reader.position += _map_header.size
+    parse_key = reader.parsers[key_type]
+    parse_value = reader.parsers[value_type]
+    index = {}
+    map_keys = []
+    map_values = []
+    for _ in range(map_size):
+        key = parse_key(reader)
+        value = parse_value(reader)
+        if type(key) is str:
+            key = sys.intern(key)
+        if key in index:
+            print("WARNING: Replacing key {} in the map.".format(key))
+            map_values[index[key]] = value
+            continue
+        index[key] = len(map_keys)
+        map_keys.append(key)
+        map_values.append(value)
+    return BinMap(tuple(map_keys), tuple(map_values))
+
+
+# HASH and STRING values are interned, so repeated names and paths share one string.
+def _parse_compact_hash(reader):
+    return sys.intern(_parse_hash(reader))
+
+
+def _parse_compact_string(reader):
+    return sys.intern(_parse_string(reader))
+
+
+# Homogeneous numeric container, values holds the flattened elements in an array.array.
+# BOOL elements are stored as bytes, boolean tells tolist() to give them back as bools.
+class BinArray(object):
+    __slots__ = ("values", "shape", "boolean")
+
+    def __init__(self, values, shape, boolean=False):
+        self.values = values
+        self.shape = shape
+        self.boolean = boolean
+
+
+    def __repr__(self):
+        return "BinArray({!r}, shape={})".format(self.values.typecode, self.shape)
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[position] for position in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("BinArray index out of range")
+
+        if len(self.shape) == 1:
+            value = self.values[idx]
+            return bool(value) if self.boolean else value
+        element_size = self._element_size()
+        return tuple(self.values[idx*element_size:(idx+1)*element_size])
+
+
+    def __eq__(self, other):
+        if isinstance(other, BinArray):
+            return self.shape == other.shape and self.values == other.values
+        return self.tolist() == other
+
+
+    # Same values as the non-array parsing: a list of scalars, or of tuples for vectors and matrices.
+    def tolist(self):
+        if len(self.shape) == 1:
+            if self.boolean:
+                return [bool(value) for value in self.values]
+            return self.values.tolist()
+        element_size = self._element_size()
+        return [tuple(self.values[idx:idx+element_size]) for idx in range(0, len(self.values), element_size)]
+
+
+    def _element_size(self):
+        element_size = 1
+        for dimension in self.shape[1:]:
+            element_size *= dimension
+        return element_size
+
+
+# Element type -> array typecode, numpy dtype, values per element, element shape
+_NUMERIC_LAYOUTS = {
+    BinFileFieldHashType.VECTOR3_UINT8.value:   ("H", "<u2", 3, (3,)),
+    BinFileFieldHashType.BOOL.value:            ("B", "?", 1, ()),
+    BinFileFieldHashType.INT8.value:            ("b", "i1", 1, ()),
+    BinFileFieldHashType.UINT8.value:           ("B", "u1", 1, ()),
+    BinFileFieldHashType.INT16.value:           ("h", "<i2", 1, ()),
+    BinFileFieldHashType.UINT16.value:          ("H", "<u2", 1, ()),
+    BinFileFieldHashType.INT32.value:           ("i", "<i4", 1, ()),
+    BinFileFieldHashType.UINT32.value:          ("I", "<u4", 1, ()),
+    BinFileFieldHashType.INT64.value:           ("q", "<i8", 1, ()),
+    BinFileFieldHashType.UINT64.value:          ("Q", "<u8", 1, ()),
+    BinFileFieldHashType.FLOAT.value:           ("f", "<f4", 1, ()),
+    BinFileFieldHashType.VECTOR2_FLOAT.value:   ("f", "<f4", 2, (2,)),
+    BinFileFieldHashType.VECTOR3_FLOAT.value:   ("f", "<f4", 3, (3,)),
+    BinFileFieldHashType.VECTOR4_FLOAT.value:   ("f", "<f4", 4, (4,)),
+    BinFileFieldHashType.MATRIX_4X4.value:      ("f", "<f4", 16, (4, 4)),
+    BinFileFieldHashType.RGBA.value:            ("B", "u1", 4, (4,)),
+    BinFileFieldHashType.HASH_LINK.value:       ("I", "<u4", 1, ()),
+}
+
+
+_NUMERIC_ELEMENT_SIZES = {element_type: struct.calcsize("<{}{}".format(layout[2], layout[0])) for element_type, layout in _NUMERIC_LAYOUTS.items()}
+
+
+def _numeric_array_factory(numeric_arrays):
+    if numeric_arrays == "array":
+        def make_array(data, position, count, layout):
+            typecode, dtype, element_size, element_shape = layout
+            values = array.array(typecode)
+            values.frombytes(data[position:position + count * element_size * values.itemsize])
+            if sys.byteorder != "little" and values.itemsize > 1:
+                values.byteswap()
+            return BinArray(values, (count,) + element_shape, dtype == "?")
+        return make_array
+
+    elif numeric_arrays == "numpy":
+        import numpy
+        def make_array(data, position, count, layout):
+            typecode, dtype, element_size, element_shape = layout
+            values = numpy.frombuffer(data, dtype=dtype, count=count * element_size, offset=position)
+            return values.reshape((count,) + element_shape).copy()
+        return make_array
+
+    raise ValueError("Unknown numeric_arrays '{}', expected 'array' or 'numpy'.".format(numeric_arrays))
+
+
+# header is the container header struct, with the element type and count at the given positions.
+def _numeric_container_parser(header, type_index, count_index, make_array):
+    def parse(reader):
+        values = header.unpack_from(reader.data, reader.position)
+        element_type, count = values[type_index], values[count_index]
+        reader.position += header.size
+
+        layout = _NUMERIC_LAYOUTS.get(element_type)
+        if layout is None:
+            parse_element = reader.parsers[element_type]
+            return [parse_element(reader) for _ in range(count)]
+
+        position = reader.position
+        reader.position += count * _NUMERIC_ELEMENT_SIZES[element_type]
+        return make_array(reader.data, position, count, layout)
+    return parse
+
+
+def _parse_array(reader):
+    array_element_type, array_size = _array_header.unpack_from(reader.data, reader.position)
+    reader.position += _array_header.size
+    parse = reader.parsers[array_element_type]
+    return [parse(reader) for _ in range(array_size)]
+
+
+def _parse_map(reader):
+    key_type, value_type, unknown, map_size = _map_header.unpack_from(reader.data, reader.position)
+    reader.position += _map_header.size
+    parse_key = reader.parsers[key_type]
+    parse_value = reader.parsers[value_type]
+    strct = {}
+    for _ in range(map_size):
+        key = parse_key(reader)
+        value = parse_value(reader)
+        if key in strct:
+            print("WARNING: Replacing key {} in the map.".format(key))
+        strct[key] = value
+    return strct
+
+
+def _unknown_parser(field_type):
+    def parse(reader):
+        try:
+            field_type_name = BinFileFieldHashType(field_type)
+        except ValueError:
+            field_type_name = field_type
+        raise NotImplementedError("A parser for a BinFileField with type '{}' is not implemented.".format(field_type_name))
+    return parse
+
+
+_FIELD_PARSERS = [_unknown_parser(field_type) for field_type in range(256)]
+for field_type, parser in (
+    (BinFileFieldHashType.VECTOR3_UINT8,    _scalar_parser("<3H", False)),
+    (BinFileFieldHashType.BOOL,             _scalar_parser("<?", True)),
+    (BinFileFieldHashType.INT8,             _scalar_parser("<b", True)),
+    (BinFileFieldHashType.UINT8,            _scalar_parser("<B", True)),
+    (BinFileFieldHashType.INT16,            _scalar_parser("<h", True)),
+    (BinFileFieldHashType.UINT16,           _scalar_parser("<H", True)),
+    (BinFileFieldHashType.INT32,            _scalar_parser("<i", True)),
+    (BinFileFieldHashType.UINT32,           _scalar_parser("<I", True)),
+    (BinFileFieldHashType.INT64,            _scalar_parser("<q", True)),
+    (BinFileFieldHashType.UINT64,           _scalar_parser("<Q", True)),
+    (BinFileFieldHashType.FLOAT,            _scalar_parser("<f", True)),
+    (BinFileFieldHashType.VECTOR2_FLOAT,    _scalar_parser("<2f", False)),
+    (BinFileFieldHashType.VECTOR3_FLOAT,    _scalar_parser("<3f", False)),
+    (BinFileFieldHashType.VECTOR4_FLOAT,    _scalar_parser("<4f", False)),
+    (BinFileFieldHashType.MATRIX_4X4,       _scalar_parser("<16f", False)),
+    (BinFileFieldHashType.RGBA,             _scalar_parser("<4B", False)),
+    (BinFileFieldHashType.STRING,           _parse_string),
+    (BinFileFieldHashType.HASH,             _parse_hash),
+    (BinFileFieldHashType.FIELD_LIST,       _parse_field_list),
+    (BinFileFieldHashType.STRUCT,           _parse_struct),
+    (BinFileFieldHashType.EMBEDDED,         _parse_embedded),
+    (BinFileFieldHashType.HASH_LINK,        _scalar_parser("<L", True)),
+    (BinFileFieldHashType.ARRAY,            _parse_array),
+    (BinFileFieldHashType.MAP,              _parse_map),
+    (BinFileFieldHashType.PADDING,          _scalar_parser("<B", True)),
+):
+    _FIELD_PARSERS[field_type.value] = parser
+
+
+_parser_tables = {}
+
+
+def _entry_parser(lazy=False, compact=False):
+    if lazy:
+        return _parse_lazy_entry
+    return _parse_compact_entry if compact else _parse_entry
+
+
+# Parser table for the given BinFile options, derived from _FIELD_PARSERS.
+def _field_parsers(lazy=False, numeric_arrays=None, compact=False):
+    key = (lazy, numeric_arrays, compact)
+    if key not in _parser_tables:
+        parsers = list(_FIELD_PARSERS)
+        if compact:
+            parsers[BinFileFieldHashType.STRUCT.value] = _parse_compact_struct
+            parsers[BinFileFieldHashType.EMBEDDED.value] = _parse_compact_embedded
+            parsers[BinFileFieldHashType.MAP.value] = _parse_compact_map
+            parsers[BinFileFieldHashType.HASH.value] = _parse_compact_hash
+            parsers[BinFileFieldHashType.STRING.value] = _parse_compact_string
+        if lazy:
+            parsers[BinFileFieldHashType.STRUCT.value] = _lazy_struct_parser(0)
+            parsers[BinFileFieldHashType.EMBEDDED.value] = _lazy_struct_parser(1)
+        if numeric_arrays is not None:
+            make_array = _numeric_array_factory(numeric_arrays)
+            parsers[BinFileFieldHashType.FIELD_LIST.value] = _numeric_container_parser(_field_list_header, 0, 2, make_array)
+            parsers[BinFileFieldHashType.ARRAY.value] = _numeric_container_parser(_array_header, 0, 1, make_array)
+        _parser_tables[key] = parsers
+    return _parser_tables[key]
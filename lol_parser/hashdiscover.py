@@ -0,0 +1,182 @@
+# Looks for the names of unknown hashes by hashing candidate names, built from wordlists and
+# templates, on a process pool. Found pairs are written in the binfile.hashes.txt format.
+#   python -m lol_parser.hashdiscover --from-bins foo.bin --wordlist words.txt --template "Characters/{word}/Skins/Skin{0-99}"
+# In a template, {word} is replaced by every word of the wordlists and {first-last} by the numbers
+# of the range, zero padded when first is ("{00-99}").
+import argparse
+import collections.abc
+import concurrent.futures
+import io
+import itertools
+import os
+import re
+import sys
+
+from .binfile import BinFile, binfile_hashes
+from .wadfile import WadFile
+
+# Words of the first {word} placeholder given to a worker at once, and candidates hashed at once.
+DISCOVER_CHUNK_WORDS = 1024
+DISCOVER_BATCH_SIZE = 65536
+
+_HASH_KINDS = {
+    "bin": (BinFile.hash_many, "{:08x} {}"),
+    "wad": (WadFile.hash_many, "{:016x} {}"),
+}
+_placeholder = re.compile(r"\{(?:(word)|(\d+)-(\d+))\}")
+
+
+# Yields the candidate names of template. Without first_words, the first {word} placeholder takes
+# its values from words like the others.
+def expand_template(template, words, first_words=None):
+    parts = []
+    position = 0
+    for match in _placeholder.finditer(template):
+        parts.append([template[position:match.start()]])
+        if match.group(1):
+            if first_words is not None:
+                parts.append(first_words)
+                first_words = None
+            else:
+                parts.append(words)
+        else:
+            first, last = match.group(2), match.group(3)
+            width = len(first) if first.startswith("0") and len(first) > 1 else 0
+            parts.append([str(number).zfill(width) for number in range(int(first), int(last) + 1)])
+        position = match.end()
+    parts.append([template[position:]])
+
+    for values in itertools.product(*parts):
+        yield "".join(values)
+
+
+# Yields the (hash, name) pairs found for the unknown hashes, at most one name per hash. kind is
+# "bin" (FNV-1a of BinFile.hash) or "wad" (path hashes of WadFile.hash). A plain wordlist is the
+# template "{word}".
+def discover(unknown, words=(), templates=("{word}",), kind="bin", workers=None, chunk_words=DISCOVER_CHUNK_WORDS):
+    if kind not in _HASH_KINDS:
+        raise ValueError("Unknown hash kind '{}', expected 'bin' or 'wad'.".format(kind))
+    words = list(words)
+    if kind == "bin":
+        words = [word for word in words if word.isascii()]
+
+    units = []
+    for template_idx, template in enumerate(templates):
+        if "{word}" in template:
+            units.extend((template_idx, start, start + chunk_words) for start in range(0, len(words), chunk_words))
+        else:
+            units.append((template_idx, None, None))
+
+    found = set()
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(set(unknown), words, list(templates), kind)) as pool:
+        units = iter(units)
+        pending = set(pool.submit(_discover_unit, *unit) for unit in itertools.islice(units, workers * 2))
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                for h, name in future.result():
+                    if h not in found:
+                        found.add(h)
+                        yield h, name
+                for unit in itertools.islice(units, 1):
+                    pending.add(pool.submit(_discover_unit, *unit))
+
+
+# Hashes used by the bins that have no name yet: field and entry hashes, and the values of HASH
+# fields (kept as decimal strings by the parser when unknown).
+def unknown_bin_hashes(bin_files):
+    unknown = set()
+    for bin_file in bin_files:
+        for entry_type, strcts in bin_file.entries.items():
+            if entry_type not in binfile_hashes:
+                unknown.add(entry_type)
+            _collect_unknown(strcts, unknown)
+    return unknown
+
+
+def _collect_unknown(value, unknown):
+    if isinstance(value, collections.abc.Mapping):
+        for k, v in value.items():
+            if k == "_hash":
+                if v not in binfile_hashes:
+                    unknown.add(v)
+                continue
+            if isinstance(k, int) and k not in binfile_hashes:
+                unknown.add(k)
+            _collect_unknown(v, unknown)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_unknown(v, unknown)
+    elif isinstance(value, str) and value.isdigit() and int(value) < 0x100000000:
+        unknown.add(int(value))
+
+
+_worker_state = None
+
+
+def _init_worker(unknown, words, templates, kind):
+    global _worker_state
+    _worker_state = (unknown, words, templates, kind)
+
+
+def _discover_unit(template_idx, start, end):
+    unknown, words, templates, kind = _worker_state
+    hash_many = _HASH_KINDS[kind][0]
+    first_words = words[start:end] if start is not None else None
+    candidates = expand_template(templates[template_idx], words, first_words)
+
+    found = []
+    while True:
+        batch = list(itertools.islice(candidates, DISCOVER_BATCH_SIZE))
+        if not batch:
+            return found
+        if kind == "bin":
+            batch = [name for name in batch if name.isascii()]
+        for h, name in zip(hash_many(batch), batch):
+            if h in unknown:
+                found.append((h, name))
+
+
+def _read_lines(path):
+    with io.open(path, "r", encoding="utf-8", errors="replace") as lines_file:
+        return [line.strip() for line in lines_file if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the names of unknown bin or wad hashes.")
+    parser.add_argument("--kind", choices=sorted(_HASH_KINDS), default="bin")
+    parser.add_argument("--unknown", action="append", default=[], help="file with one hexadecimal hash per line")
+    parser.add_argument("--from-bins", nargs="+", default=[], help="bin files whose unknown hashes are looked for")
+    parser.add_argument("--from-wads", nargs="+", default=[], help="wad files whose path hashes are looked for")
+    parser.add_argument("--wordlist", action="append", default=[])
+    parser.add_argument("--template", action="append", default=[])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="file the found hashes are appended to, stdout by default")
+    args = parser.parse_args()
+
+    unknown = set()
+    for path in args.unknown:
+        unknown.update(int(line.split()[0], 16) for line in _read_lines(path))
+    if args.from_bins:
+        unknown.update(unknown_bin_hashes(BinFile(file_path=path) for path in args.from_bins))
+    for path in args.from_wads:
+        unknown.update(WadFile(path).file_headers.path_hashes)
+
+    words = []
+    for path in args.wordlist:
+        words.extend(_read_lines(path))
+
+    line_format = _HASH_KINDS[args.kind][1]
+    output = io.open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for h, name in discover(unknown, words, args.template or ["{word}"], args.kind, args.workers):
+            output.write(line_format.format(h, name) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
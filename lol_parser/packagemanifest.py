@@ -1,45 +1,198 @@
+import concurrent.futures
+import contextlib
 import io
 import requests
+import requests.adapters
 import os.path
+import threading
+import time
 import urllib.parse
+import urllib3
 import zlib
 from collections import defaultdict
 
-_session = requests.Session()
-CHUNK_SIZE = 1024
+CHUNK_SIZE = 64 * 1024
 REQUESTS_TIMEOUT = 30
 
+# Downloads read CHUNK_SIZE bytes at first, the chunk size doubles (up to DOWNLOAD_MAX_CHUNK_SIZE)
+# while reading a chunk takes less than half of _CHUNK_TARGET_SECONDS, and halves when it takes more than twice.
+DOWNLOAD_MAX_CHUNK_SIZE = 4 * 1024 * 1024
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_HOST_CONNECTIONS = 8
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 0.5
+# download_bin fetches the files of a BIN less than DOWNLOAD_RANGE_GAP bytes apart with a single Range request.
+DOWNLOAD_RANGE_GAP = 64 * 1024
+_CHUNK_TARGET_SECONDS = 0.1
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+# Session whose connection pool can serve pool_size concurrent requests per host.
+def make_session(pool_size=DOWNLOAD_WORKERS):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = make_session()
+
+
+# The shared session when its pool is big enough for workers, otherwise a bigger one closed on exit.
+@contextlib.contextmanager
+def _download_session(workers):
+    if workers <= DOWNLOAD_WORKERS:
+        yield _session
+    else:
+        with make_session(workers) as session:
+            yield session
+
+
+class PackageDownloadProgress(object):
+    def __init__(self, files_total=0, bytes_total=0):
+        self.files_total = files_total
+        self.files_done = 0
+        self.bytes_total = bytes_total
+        self.bytes_downloaded = 0
+        self.retries = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<PackageDownloadProgress {}/{} files, {}/{} bytes, {:.1f} KB/s, {} retries>".format(
+            self.files_done, self.files_total, self.bytes_downloaded, self.bytes_total, self.throughput / 1024, self.retries)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    # Bytes downloaded per second since the start.
+    @property
+    def throughput(self):
+        return self.bytes_downloaded / max(self.elapsed, 1e-6)
+
+    def _add_bytes(self, size):
+        with self._lock:
+            self.bytes_downloaded += size
+
+    def _add_total_bytes(self, size):
+        with self._lock:
+            self.bytes_total += size
+
+    def _add_file(self, count=1):
+        with self._lock:
+            self.files_done += count
+
+    def _add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+
+# Limits the number of concurrent requests per host.
+class _HostLimiter(object):
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+
+def _adaptive_chunks(response):
+    chunk_size = CHUNK_SIZE
+    while True:
+        started = time.monotonic()
+        chunk = response.raw.read(chunk_size, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+        elapsed = time.monotonic() - started
+        if elapsed < _CHUNK_TARGET_SECONDS / 2 and chunk_size < DOWNLOAD_MAX_CHUNK_SIZE:
+            chunk_size *= 2
+        elif elapsed > _CHUNK_TARGET_SECONDS * 2 and chunk_size > CHUNK_SIZE:
+            chunk_size //= 2
+
+
+# Streams url to write, retrying connection errors and 429/5xx answers with an exponential backoff.
+# start is called with the response before its data on each attempt, so a partial output can be
+# thrown away. write returns True once it doesn't need the rest of the answer.
+def _fetch(url, start, write, session=None, headers=None, retries=DOWNLOAD_RETRIES, limiter=None, progress=None):
+    session = session or _session
+    for attempt in range(retries + 1):
+        attempt_bytes = 0
+        try:
+            with limiter(url) if limiter else contextlib.nullcontext():
+                with session.get(url, stream=True, timeout=REQUESTS_TIMEOUT, headers=headers) as r:
+                    r.raise_for_status()
+                    start(r)
+                    for chunk in _adaptive_chunks(r):
+                        attempt_bytes += len(chunk)
+                        if progress:
+                            progress._add_bytes(len(chunk))
+                        if write(chunk):
+                            break
+            return
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError, urllib3.exceptions.HTTPError) as e:
+            if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code not in _RETRY_STATUS:
+                raise
+            if attempt == retries:
+                raise
+            if progress:
+                progress._add_bytes(-attempt_bytes)
+                progress._add_retry()
+            time.sleep(DOWNLOAD_BACKOFF * 2 ** attempt)
+
+
 class PackageManifestFile(object):
     # PS: Some claim that the "ukn" is type, but there is no doc on what it belongs to. Also, on almost all the cases it is 0, so it does not look like the file type.
-    def __init__(self, full_file_path, offset, size, ukn):
+    # containing_file is the BIN file holding the data, at offset.
+    def __init__(self, full_file_path, offset, size, ukn, containing_file=None):
         self.full_file_path = full_file_path
         self.path, self.real_name = os.path.split(self.full_file_path)
         self.name = self.real_name.replace(".compressed", "")
         self.compressed = self.real_name.endswith(".compressed")
-        self.offset = offset
-        self.size = size
+        self.offset = int(offset)
+        self.size = int(size)
         self.ukn = ukn
+        self.containing_file = containing_file
 
-    def download(self, base_url, out_file=None, out_dir=None):
+        # Path of the file in the release (after ".../files/"), without the .compressed extension
+        self.release_path = self.full_file_path.split("/files/", 1)[-1].lstrip("/")
+        if self.compressed:
+            self.release_path = self.release_path[:-len(".compressed")]
+
+    def download(self, base_url, out_file=None, out_dir=None, session=None, retries=DOWNLOAD_RETRIES, limiter=None, progress=None):
         url = urllib.parse.urljoin(base_url, self.full_file_path.lstrip("/"))
         out_file_path = os.path.join(out_dir or self.path, out_file or self.name)
         os.makedirs(out_dir or self.path, exist_ok=True)
 
-        r = _session.get(url, stream=True, timeout=REQUESTS_TIMEOUT)
-
         decoder = None
-        if self.compressed:
-            decoder = zlib.decompressobj(zlib.MAX_WBITS) # Zlib
-
         with open(out_file_path, 'wb') as out_file:
-            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-                if not chunk:
-                    continue
+            def start(response):
+                nonlocal decoder
+                out_file.seek(0)
+                out_file.truncate()
+                if self.compressed:
+                    decoder = zlib.decompressobj(zlib.MAX_WBITS) # Zlib
 
+            def write(chunk):
                 if decoder:
                     chunk = decoder.decompress(chunk)
-
                 out_file.write(chunk)
+
+            _fetch(url, start, write, session=session, retries=retries, limiter=limiter, progress=progress)
+            if decoder:
+                out_file.write(decoder.flush())
+
+        if progress:
+            progress._add_file()
         return out_file_path
 
     def extract(self, buff, directory):
@@ -51,7 +204,7 @@ class PackageManifestFile(object):
             decoder = zlib.decompressobj(zlib.MAX_WBITS) # Zlib
 
         with io.open(out_file_path, "wb") as out_file:
-            data_left = self.compressed_file_size if self.compressed else self.file_size
+            data_left = self.size
             while True:
                 if data_left <= 0:
                     break
@@ -64,6 +217,8 @@ class PackageManifestFile(object):
                     data = decoder.decompress(data)
 
                 out_file.write(data)
+            if decoder:
+                out_file.write(decoder.flush())
         return out_file_path
 
     def content(self, base_url=None, buff=None):
@@ -72,7 +227,7 @@ class PackageManifestFile(object):
             url = urllib.parse.urljoin(base_url, self.full_file_path.lstrip("/"))
             data = _session.get(url).content
         elif buff:
-            data = buff.read(self.compressed_file_size if self.compressed else self.file_size)
+            data = buff.read(self.size)
         else:
             raise AttributeError("You should provide base_url or buff at least.")
 
@@ -81,19 +236,189 @@ class PackageManifestFile(object):
         return data
 
 
+# Writes the files of a span of a BIN (sorted by offset) from the data of a Range request on it.
+# other_spans are the (start, end, files) spans of the same BIN that follow it.
+class _BinRangeSlicer(object):
+    def __init__(self, start, end, files, out_dir, progress, other_spans=()):
+        self.start = start
+        self.end = end
+        self.files = files
+        self.out_dir = out_dir
+        self.progress = progress
+        self.other_spans = other_spans
+        self.whole = False
+        self._position = start
+        self._next_file = 0
+        self._open_files = []
+
+    # A server ignoring the Range header answers with the whole BIN, the files of other_spans are
+    # then written from that answer too instead of being requested.
+    def begin(self, response):
+        self.close()
+        if response.status_code != 206 and not self.whole:
+            self.whole = True
+            self.files = self.files + [f for span in self.other_spans for f in span[2]]
+            if self.progress:
+                requested = self.end - self.start + sum(end - start for start, end, files in self.other_spans)
+                self.progress._add_total_bytes(max(f.offset + f.size for f in self.files) - requested)
+        self._position = 0 if self.whole else self.start
+        self._next_file = 0
+
+    # Returns True once every file is written, the rest of a whole BIN is not read.
+    def write(self, chunk):
+        chunk_start = self._position
+        chunk_end = chunk_start + len(chunk)
+        self._position = chunk_end
+
+        while self._next_file < len(self.files) and self.files[self._next_file].offset < chunk_end:
+            self._open_files.append(_BinFileWriter(self.files[self._next_file], self.out_dir))
+            self._next_file += 1
+
+        for writer in list(self._open_files):
+            f = writer.package_file
+            low, high = max(f.offset, chunk_start), min(f.offset + f.size, chunk_end)
+            if high > low:
+                writer.write(chunk[low - chunk_start:high - chunk_start])
+            if f.offset + f.size <= chunk_end:
+                writer.close()
+                self._open_files.remove(writer)
+        return self._next_file == len(self.files) and not self._open_files
+
+    # Files left at the end of the span are the empty ones.
+    def finish(self):
+        for f in self.files[self._next_file:]:
+            self._open_files.append(_BinFileWriter(f, self.out_dir))
+        self._next_file = len(self.files)
+        for writer in self._open_files:
+            if writer.written != writer.package_file.size:
+                raise IOError("Got {} bytes for {} out of {}.".format(writer.written, writer.package_file.full_file_path, writer.package_file.size))
+            writer.close()
+        self._open_files = []
+        # Counted once the span is done, as a retry writes its files again
+        if self.progress:
+            self.progress._add_file(len(self.files))
+
+    def close(self):
+        for writer in self._open_files:
+            writer.close()
+        self._open_files = []
+
+
+class _BinFileWriter(object):
+    def __init__(self, package_file, out_dir):
+        self.package_file = package_file
+        self.written = 0
+        out_file_path = os.path.join(out_dir, package_file.release_path)
+        os.makedirs(os.path.dirname(out_file_path) or ".", exist_ok=True)
+        self._out_file = io.open(out_file_path, "wb")
+        self._decoder = zlib.decompressobj(zlib.MAX_WBITS) if package_file.compressed else None # Zlib
+
+    def write(self, data):
+        self.written += len(data)
+        if self._decoder:
+            data = self._decoder.decompress(data)
+        self._out_file.write(data)
+
+    def close(self):
+        if self._out_file.closed:
+            return
+        if self._decoder and self.written == self.package_file.size:
+            self._out_file.write(self._decoder.flush())
+        self._out_file.close()
+
+
+# Merges the spans of files (sorted by offset) less than gap bytes apart, as (start, end, files).
+def _coalesce_spans(files, gap):
+    spans = []
+    for f in sorted(files, key=lambda f: f.offset):
+        if spans and f.offset <= spans[-1][1] + gap:
+            spans[-1][1] = max(spans[-1][1], f.offset + f.size)
+            spans[-1][2].append(f)
+        else:
+            spans.append([f.offset, f.offset + f.size, [f]])
+    return [tuple(span) for span in spans]
+
+
+# Returns whether the server answered with the whole BIN, other_spans being written from it too.
+def _download_span(url, start, end, files, out_dir, session, retries, limiter, progress, other_spans=()):
+    slicer = _BinRangeSlicer(start, end, files, out_dir, progress, other_spans)
+    try:
+        if end > start:
+            headers = {"Range": "bytes={}-{}".format(start, end - 1)}
+            _fetch(url, slicer.begin, slicer.write, session=session, headers=headers, retries=retries, limiter=limiter, progress=progress)
+        slicer.finish()
+    finally:
+        slicer.close()
+    return slicer.whole
+
+
 class PackageManifest(object):
-    def __init__(self, data):
+    # packages_url is the URL of the directory holding the BIN files, known when using from_live.
+    def __init__(self, data, packages_url=None):
         self.files = []
         self.files_by_containing_file = defaultdict(list)
+        self.packages_url = packages_url
         self._parse_manifest(data)
 
-    def download_all(self, base_url, out_dir=None):
-        for f in self.files:
-            f.download(base_url, out_dir=out_dir)
+    # Downloads the files on workers threads sharing one connection pool, with at most per_host
+    # requests at once per host. Returns the PackageDownloadProgress, also given to callback each
+    # time a file is done.
+    def download_all(self, base_url, out_dir=None, workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_HOST_CONNECTIONS, retries=DOWNLOAD_RETRIES, callback=None):
+        progress = PackageDownloadProgress(len(self.files), sum(f.size for f in self.files))
+        limiter = _HostLimiter(per_host)
+
+        def download(f):
+            f.download(base_url, out_dir=out_dir, session=session, retries=retries, limiter=limiter, progress=progress)
+            if callback:
+                callback(progress)
 
-    def download_bin(self):
+        with _download_session(workers) as session, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(download, f) for f in self.files]
+            for future in futures:
+                future.result()
+        return progress
+
+    # Downloads files (all of them by default) out of their BIN files instead of one by one, into
+    # out_dir under their release_path. The files of a BIN less than gap bytes apart are fetched with
+    # a single Range request, and sliced (and decompressed) out of its answer as it streams. The
+    # other spans of a BIN are requested once its first one is done: when the server ignored the
+    # Range header, that answer was the whole BIN and every span was written from it already.
+    # Returns the PackageDownloadProgress, also given to callback each time a request is done.
+    def download_bin(self, packages_url=None, out_dir=".", files=None, gap=DOWNLOAD_RANGE_GAP, workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_HOST_CONNECTIONS, retries=DOWNLOAD_RETRIES, callback=None):
         # http://l3cdn.riotgames.com/releases/live/projects/league_client/releases/0.0.0.105/packages/files/BIN_0x00000000
-        raise NotImplementedError("We didn't implement this feature yet")
+        packages_url = packages_url or self.packages_url
+        if not packages_url:
+            raise AttributeError("You should provide packages_url, or get the manifest with from_live.")
+        if not packages_url.endswith("/"):
+            packages_url += "/"
+
+        files_by_containing_file = defaultdict(list)
+        for f in (self.files if files is None else files):
+            files_by_containing_file[f.containing_file].append(f)
+        bins = []
+        for containing_file in sorted(files_by_containing_file):
+            url = urllib.parse.urljoin(packages_url, containing_file)
+            bins.append((url, _coalesce_spans(files_by_containing_file[containing_file], gap)))
+
+        spans = [span for url, bin_spans in bins for span in bin_spans]
+        progress = PackageDownloadProgress(sum(len(span_files) for start, end, span_files in spans), sum(end - start for start, end, span_files in spans))
+        limiter = _HostLimiter(per_host)
+
+        # Returns the spans left to request
+        def download(url, span, other_spans=()):
+            whole = _download_span(url, *span, out_dir=out_dir, session=session, retries=retries, limiter=limiter, progress=progress, other_spans=other_spans)
+            if callback:
+                callback(progress)
+            return [] if whole else [(url, other_span) for other_span in other_spans]
+
+        with _download_session(workers) as session, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set(pool.submit(download, url, bin_spans[0], bin_spans[1:]) for url, bin_spans in bins)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for url, span in future.result():
+                        pending.add(pool.submit(download, url, span))
+        return progress
 
     def _parse_manifest(self, data):
         entries = data.split("\r\n")
@@ -111,6 +436,7 @@ class PackageManifest(object):
                 containing_file_offset,
                 file_size,
                 unknown,
+                containing_file,
             )
             self.files.append(pmf)
             self.files_by_containing_file[containing_file].append(pmf)
@@ -119,4 +445,4 @@ class PackageManifest(object):
     def from_live(base_url, project_name, project_version):
         url = urllib.parse.urljoin(base_url, "projects/{}/releases/{}/packages/files/packagemanifest".format(project_name, project_version))
         r = _session.get(url)
-        return PackageManifest(r.text)
+        return PackageManifest(r.text, packages_url=urllib.parse.urljoin(url, "."))
@@ -1,9 +1,17 @@
+import array
+import bisect
+import collections
+import collections.abc
+import fnmatch
 import io
+import re
 import struct
 
 # http://l3cdn.riotgames.com/releases/live/projects/{project_name}/releases/{version}/releasemanifest
 
 class ReleaseManifestDirectory(object):
+    __slots__ = ("name", "sub_directories", "files")
+
     def __init__(self, name, sub_directories, files):
         self.name = name
         self.sub_directories = sub_directories
@@ -21,8 +29,11 @@ class ReleaseManifestDirectory(object):
 
 
 class ReleaseManifestFile(object):
+    __slots__ = ("name", "version", "hash_checksum", "flags", "size", "compressed_size", "ukn1", "file_type", "ukn2", "ukn3", "path")
+
     # According to https://github.com/LoL-Fantome/Fantome.Libraries.League, ukn1+file_type+ukn2+ukn3 (int64) is the date value.
-    def __init__(self, name, version, hash_checksum, flags, size, compressed_size, ukn1, file_type, ukn2, ukn3):
+    # path is the full path of the file, relative to the root directory of the manifest.
+    def __init__(self, name, version, hash_checksum, flags, size, compressed_size, ukn1, file_type, ukn2, ukn3, path=None):
         self.name             = name
         self.version          = version
         self.hash_checksum    = hash_checksum
@@ -33,6 +44,7 @@ class ReleaseManifestFile(object):
         self.file_type        = file_type
         self.ukn2             = ukn2
         self.ukn3             = ukn3
+        self.path             = path
 
         # Known Flags:
         # 0x01 :  Managedfiles dir (?)
@@ -51,95 +63,321 @@ class ReleaseManifestFile(object):
     def __str__(self):
         return "<File {}>".format(self.name)
 
+# Objects of a table of records, created on first access.
+class _ReleaseManifestRecords(collections.abc.Sequence):
+    def __init__(self, records, factory):
+        self._records = records
+        self._factory = factory
+        self._objects = [None] * len(records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self._records)))]
+        obj = self._objects[idx]
+        if obj is None:
+            if idx < 0:
+                idx += len(self._records)
+            obj = self._objects[idx] = self._factory(idx, self._records[idx])
+        return obj
+
+
+_header_struct = struct.Struct("<4sII4BI")
+_directory_struct = struct.Struct("<IIIII")
+_file_struct = struct.Struct("<IIQQIIIIHBB")
+_count_struct = struct.Struct("<I")
+_strings_header_struct = struct.Struct("<II")
+
+
+# files and directories are sequences whose ReleaseManifestFile/ReleaseManifestDirectory objects
+# are only created when accessed, from the records decoded at once when parsing.
+# Files can be looked up by their full path (case insensitive, "/" or "\\" separated), using an
+# index built on first use. A file created on its own only needs the paths of the directories.
 class ReleaseManifest(object):
     def __init__(self, file_path):
         self.path = file_path
         self.files = []
         self.directories = []
         self.strings = []
+        self._file_records = []
+        self._directory_records = []
+        self._file_paths = None
+        self._directory_paths = None
+        self._directory_file_starts = None
+        self._directory_file_ranges = None
+        self._paths_index = None
+        self._sorted_paths = None
+        self._sorted_files = None
 
         self._parse_manifest()
 
-    def _parse_manifest(self):
-        unparsed_directories = []
-        unparsed_files = []
+    # Full paths of the files, in the order of self.files.
+    @property
+    def file_paths(self):
+        self._build_file_paths()
+        return self._file_paths
+
+    # Full paths of the directories, in the order of self.directories.
+    @property
+    def directory_paths(self):
+        self._build_directory_paths()
+        return self._directory_paths
+
+    # See diff_release_manifests, self being the old manifest.
+    def diff(self, new):
+        return diff_release_manifests(self, new)
+
+    def file(self, path):
+        self._build_index()
+        idx = self._paths_index.get(_normalize_path(path))
+        if idx is None:
+            raise KeyError("The file {} is not known on this manifest.".format(path))
+        return self.files[idx]
+
+    def __contains__(self, path):
+        self._build_index()
+        return _normalize_path(path) in self._paths_index
+
+    # Files whose path is under the directory path, sorted by path.
+    def files_under(self, directory):
+        directory = _normalize_path(directory)
+        start, end = self._sorted_range(directory + "/" if directory else "")
+        return [self.files[idx] for idx in self._sorted_files[start:end]]
+
+    # Files whose path matches the fnmatch pattern (case insensitive), sorted by path. Only the
+    # paths starting like the pattern (up to its first wildcard) are compared to it.
+    def glob(self, pattern):
+        pattern = _normalize_path(pattern)
+        wildcard = min((pattern.find(c) for c in "*?[" if c in pattern), default=len(pattern))
+        start, end = self._sorted_range(pattern[:wildcard])
+        return [self.files[self._sorted_files[position]] for position in range(start, end) if fnmatch.fnmatchcase(self._sorted_paths[position], pattern)]
 
+    # Positions of the sorted paths starting with prefix.
+    def _sorted_range(self, prefix):
+        self._build_index()
+        start = bisect.bisect_left(self._sorted_paths, prefix)
+        end = bisect.bisect_left(self._sorted_paths, prefix + "\U0010ffff", lo=start)
+        return start, end
+
+    # One pass over the directories from the root. Also keeps the (files start, files end,
+    # directory) ranges of the reachable directories, sorted, to find the directory of a file.
+    def _build_directory_paths(self):
+        if self._directory_paths is not None:
+            return
+
+        directory_paths = [None] * len(self._directory_records)
+        file_ranges = []
+        pending = []
+        if directory_paths:
+            directory_paths[0] = self.strings[self._directory_records[0][0]]
+            pending.append(0)
+        while pending:
+            directory_idx = pending.pop()
+            name_index, sub_directories_start_index, sub_directories_count, files_start_index, files_count = self._directory_records[directory_idx]
+            path = directory_paths[directory_idx]
+            prefix = path + "/" if path else ""
+            if files_count:
+                file_ranges.append((files_start_index, files_start_index + files_count, directory_idx))
+            for sub_directory_idx in range(sub_directories_start_index, sub_directories_start_index + sub_directories_count):
+                if directory_paths[sub_directory_idx] is None:
+                    directory_paths[sub_directory_idx] = prefix + self.strings[self._directory_records[sub_directory_idx][0]]
+                    pending.append(sub_directory_idx)
+
+        file_ranges.sort()
+        self._directory_file_starts = [files_start_index for files_start_index, files_end_index, directory_idx in file_ranges]
+        self._directory_file_ranges = file_ranges
+        self._directory_paths = directory_paths
+
+    # Path of the directory holding the file idx, None when it is not reachable from the root.
+    def _file_directory_path(self, idx):
+        self._build_directory_paths()
+        position = bisect.bisect_right(self._directory_file_starts, idx) - 1
+        if position >= 0:
+            files_start_index, files_end_index, directory_idx = self._directory_file_ranges[position]
+            if idx < files_end_index:
+                return self._directory_paths[directory_idx]
+        return None
+
+    def _file_path(self, idx):
+        name = self.strings[self._file_records[idx][0]]
+        path = self._file_directory_path(idx)
+        return path + "/" + name if path else name
+
+    # Gives each file the path of its directory, files not reachable from the root are kept under
+    # their own name.
+    def _build_file_paths(self):
+        if self._file_paths is not None:
+            return
+
+        self._build_directory_paths()
+        strings, file_records = self.strings, self._file_records
+        file_paths = [None] * len(file_records)
+        for files_start_index, files_end_index, directory_idx in self._directory_file_ranges:
+            path = self._directory_paths[directory_idx]
+            prefix = path + "/" if path else ""
+            for file_idx in range(files_start_index, files_end_index):
+                file_paths[file_idx] = prefix + strings[file_records[file_idx][0]]
+
+        for idx, file_path in enumerate(file_paths):
+            if file_path is None:
+                file_paths[idx] = strings[file_records[idx][0]]
+        self._file_paths = file_paths
+
+    # The case insensitive path -> file index dict, and the files sorted by path.
+    def _build_index(self):
+        if self._paths_index is not None:
+            return
+
+        self._build_file_paths()
+        file_paths = self._file_paths
+        lower_paths = [_normalize_path(file_path) for file_path in file_paths]
+        paths_index = {}
+        for idx, lower_path in enumerate(lower_paths):
+            paths_index.setdefault(lower_path, idx)
+        sorted_files = sorted(range(len(lower_paths)), key=lower_paths.__getitem__)
+
+        self._sorted_paths = [lower_paths[idx] for idx in sorted_files]
+        self._sorted_files = array.array("I", sorted_files)
+        self._paths_index = paths_index
+
+    def _parse_manifest(self):
         with io.open(self.path, "rb") as manifest_file:
-            buff = io.BufferedReader(manifest_file)
-
-            magic = struct.unpack("<4s", buff.read(4))[0] # b"RLSM"
-            self.type, self.entries = struct.unpack("<II", buff.read(8))
-
-            v4, v3, v2, v1 = struct.unpack("<4B", buff.read(4))
-            self.version = "{}.{}.{}.{}".format(v1, v2, v3, v4)
-
-            directories_count = struct.unpack("<I", buff.read(4))[0]
-            directory_struct = struct.Struct("<IIIII")
-            for _ in range(directories_count):
-                name_index, sub_directories_start_index, sub_directories_count, files_start_index, files_count = directory_struct.unpack(buff.read(directory_struct.size))
-                unparsed_directories.append({
-                    "name_index": name_index,
-                    "sub_directories_start_index": sub_directories_start_index,
-                    "sub_directories_count": sub_directories_count,
-                    "files_start_index": files_start_index,
-                    "files_count": files_count,
-                })
-
-            files_count = struct.unpack("<I", buff.read(4))[0]
-            file_struct = struct.Struct("<IIQQIIIIHBB")
-            for _ in range(files_count):
-                name_index, version, hash_checksum_1, hash_checksum_2, flags, size, compressed_size, ukn1, file_type, ukn2, ukn3 = file_struct.unpack(buff.read(file_struct.size))
-                unparsed_files.append({
-                    "name_index":       name_index,
-                    "version":          version,
-                    "hash_checksum":    hex(hash_checksum_1) + hex(hash_checksum_2)[2:],
-                    "flags":            flags,
-                    "size":             size,
-                    "compressed_size":  compressed_size,
-                    "ukn1":             ukn1,
-                    "file_type":        file_type,
-                    "ukn2":             ukn2,
-                    "ukn3":             ukn3,
-                })
-
-            strings_count, string_size = struct.unpack("<II", buff.read(8))
-            character_struct = struct.Struct("B")
-            for _ in range(strings_count):
-                chars = []
-                while True:
-                    c = character_struct.unpack(buff.read(character_struct.size))[0]
-                    if not c:
-                        break
-                    chars.append(chr(c))
-
-                self.strings.append("".join(chars))
-
-            for data in unparsed_files:
-                self.files.append(
-                    ReleaseManifestFile(
-                        name = self.strings[data["name_index"]],
-                        version = data["version"],
-                        hash_checksum = data["hash_checksum"],
-                        flags = data["flags"],
-                        size = data["size"],
-                        compressed_size = data["compressed_size"],
-                        ukn1 = data["ukn1"],
-                        file_type = data["file_type"],
-                        ukn2 = data["ukn2"],
-                        ukn3 = data["ukn3"],
-                    )
-                )
-
-            for data in unparsed_directories:
-                self.directories.append(
-                    ReleaseManifestDirectory(
-                        name = self.strings[data["name_index"]],
-                        sub_directories = [],
-                        files = [self.files[idx] for idx in range(data["files_count"])]
-                    )
-                )
-
-            for (idx, directory) in enumerate(self.directories):
-                data = unparsed_directories[idx]
-                for directory_offset in range(data["sub_directories_count"]):
-                    directory.sub_directories.append(self.directories[data["sub_directories_start_index"]+directory_offset])
+            data = manifest_file.read()
+
+        magic, self.type, self.entries, v4, v3, v2, v1, directories_count = _header_struct.unpack_from(data, 0) # magic is b"RLSM"
+        self.version = "{}.{}.{}.{}".format(v1, v2, v3, v4)
+        pos = _header_struct.size
+
+        directories_end = pos + directories_count * _directory_struct.size
+        directory_records = list(_directory_struct.iter_unpack(data[pos:directories_end]))
+        pos = directories_end
+
+        files_count = _count_struct.unpack_from(data, pos)[0]
+        pos += _count_struct.size
+        files_end = pos + files_count * _file_struct.size
+        file_records = list(_file_struct.iter_unpack(data[pos:files_end]))
+        pos = files_end
+
+        strings_count, string_size = _strings_header_struct.unpack_from(data, pos)
+        pos += _strings_header_struct.size
+        # Each string is NUL terminated, bytes are read as code points like chr() did
+        self.strings = data[pos:pos + string_size].decode("latin-1").split("\0")[:strings_count]
+
+        self._file_records = file_records
+        self._directory_records = directory_records
+        self.files = _ReleaseManifestRecords(file_records, self._make_file)
+        self.directories = _ReleaseManifestRecords(directory_records, self._make_directory)
+
+    def _make_file(self, idx, record):
+        name_index, version, hash_checksum_1, hash_checksum_2, flags, size, compressed_size, ukn1, file_type, ukn2, ukn3 = record
+        return ReleaseManifestFile(
+            name = self.strings[name_index],
+            version = version,
+            hash_checksum = hex(hash_checksum_1) + hex(hash_checksum_2)[2:],
+            flags = flags,
+            size = size,
+            compressed_size = compressed_size,
+            ukn1 = ukn1,
+            file_type = file_type,
+            ukn2 = ukn2,
+            ukn3 = ukn3,
+            path = self._file_paths[idx] if self._file_paths is not None else self._file_path(idx),
+        )
+
+    def _make_directory(self, idx, record):
+        name_index, sub_directories_start_index, sub_directories_count, files_start_index, files_count = record
+        return ReleaseManifestDirectory(
+            name = self.strings[name_index],
+            sub_directories = self.directories[sub_directories_start_index:sub_directories_start_index + sub_directories_count],
+            files = self.files[files_start_index:files_start_index + files_count],
+        )
+
+
+def _normalize_path(path):
+    return path.replace("\\", "/").strip("/").lower()
+
+
+# File versions are stored as an int, each byte being a part of the dotted version.
+def _version_string(version):
+    return "{}.{}.{}.{}".format(version >> 24 & 0xff, version >> 16 & 0xff, version >> 8 & 0xff, version & 0xff)
+
+
+class ReleaseManifestDiff(object):
+    # added holds the files of the new manifest, removed those of the old one, changed (old, new) pairs.
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.added_bytes = sum(f.size for f in added)
+        self.removed_bytes = sum(f.size for f in removed)
+        self.changed_bytes = sum(new.size for old, new in changed)
+
+    def __repr__(self):
+        return "<ReleaseManifestDiff {} added ({} bytes), {} removed ({} bytes), {} changed ({} bytes)>".format(
+            len(self.added), self.added_bytes, len(self.removed), self.removed_bytes, len(self.changed), self.changed_bytes)
+
+    # Files to download for the added and changed files, from the package manifest of the new release.
+    def download_plan(self, package_manifest):
+        return ReleaseManifestDownloadPlan(self.added + [new for old, new in self.changed], package_manifest)
+
+
+class ReleaseManifestDownloadPlan(object):
+    # bins maps each containing BIN file (sorted by name) to its PackageManifestFiles sorted by offset.
+    # missing holds the release files that have no package file for their version.
+    def __init__(self, files, package_manifest):
+        package_files = {}
+        for package_file in package_manifest.files:
+            match = _package_path.match(package_file.full_file_path)
+            if match:
+                package_files[(match.group(1), _normalize_path(match.group(2)))] = package_file
+
+        bins = collections.defaultdict(list)
+        self.missing = []
+        for f in files:
+            package_file = package_files.get((_version_string(f.version), _normalize_path(f.path or f.name)))
+            if package_file is None:
+                self.missing.append(f)
+            else:
+                bins[package_file.containing_file].append(package_file)
+
+        self.bins = collections.OrderedDict()
+        for containing_file in sorted(bins):
+            self.bins[containing_file] = sorted(bins[containing_file], key=lambda package_file: package_file.offset)
+        self.total_bytes = sum(package_file.size for package_files in self.bins.values() for package_file in package_files)
+
+    def __repr__(self):
+        return "<ReleaseManifestDownloadPlan {} files in {} bins, {} bytes, {} missing>".format(
+            sum(len(package_files) for package_files in self.bins.values()), len(self.bins), self.total_bytes, len(self.missing))
+
+
+# projects/{project_name}/releases/{version}/files/{path}[.compressed]
+_package_path = re.compile(r"^/?projects/[^/]+/releases/([^/]+)/files/(.+?)(?:\.compressed)?$")
+
+
+# Matches the files of both manifests by full path (case insensitive), a file is changed when its
+# checksum, size or version differs. Only the files that differ are created.
+def diff_release_manifests(old, new):
+    old._build_index()
+    new._build_index()
+
+    added, removed, changed = [], [], []
+    for path, new_idx in new._paths_index.items():
+        old_idx = old._paths_index.get(path)
+        if old_idx is None:
+            added.append(new.files[new_idx])
+            continue
+        old_record, new_record = old._file_records[old_idx], new._file_records[new_idx]
+        # version, checksum (2 parts) and size
+        if old_record[1:4] != new_record[1:4] or old_record[5] != new_record[5]:
+            changed.append((old.files[old_idx], new.files[new_idx]))
+
+    for path, old_idx in old._paths_index.items():
+        if path not in new._paths_index:
+            removed.append(old.files[old_idx])
+
+    for files in (added, removed):
+        files.sort(key=lambda f: f.path.lower())
+    changed.sort(key=lambda pair: pair[1].path.lower())
+    return ReleaseManifestDiff(added, removed, changed)
@@ -1,12 +1,32 @@
+import array
+import bisect
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import fnmatch
 import hashlib
 import io
+import itertools
+import mmap
 import os
 import os.path
+import re
+import shutil
 import struct
+import sys
+import threading
 import zlib
 import xxhash
 import zstd # https://github.com/indygreg/python-zstandard
 
+# Upper bound of compressed + decompressed bytes held by a parallel extraction at once
+EXTRACT_MAX_IN_FLIGHT = 256 * 1024 * 1024
+# Size of the decompressed chunks produced by WadFileHeader.stream()
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Amount of raw data hashed per task by verify_wads()
+VERIFY_BATCH_SIZE = 4 * 1024 * 1024
+
 
 class WadFileHeader(object):
     def __init__(self, hashed_file_name, offset, compressed_file_size, file_size, compressed, extra_args):
@@ -18,13 +38,31 @@ class WadFileHeader(object):
         self.extra = extra_args
 
 
-    def extract(self, directory, buff):
+    # file_name is the path of the output file relative to directory, defaults to hashed_file_name.
+    def extract(self, directory, buff, file_name=None):
+        if self.compressed == 2: # Redirection
+            return
+
+        self._write(directory, _RawEntryReader(buff, self.offset, self.stored_size()), file_name)
+
+
+    # Same as extract(), for callers that already hold the raw (still compressed) bytes.
+    def extract_raw(self, directory, raw):
         if self.compressed == 2: # Redirection
             return
 
-        file_name = os.path.join(directory, self.hashed_file_name)
+        self._write(directory, _RawEntryReader(memoryview(raw), 0, len(raw)))
+
+
+    def _write(self, directory, raw_reader, file_name=None):
+        if file_name:
+            file_name = os.path.join(directory, file_name.lstrip("/"))
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        else:
+            file_name = os.path.join(directory, self.hashed_file_name)
         with io.open(file_name, "wb") as out_file:
-            out_file.write(self.data(buff))
+            for chunk in _stream(self.compressed, raw_reader, STREAM_CHUNK_SIZE):
+                out_file.write(chunk)
 
 
     def content(self, buff):
@@ -32,45 +70,379 @@ class WadFileHeader(object):
         return self.data(buff)
 
 
+    def stored_size(self):
+        if self.compressed:
+            return self.compressed_file_size
+        return self.file_size
+
+
+    # buff can be a file object or a memoryview/mmap over the whole WAD, in which case
+    # a zero-copy memoryview slice is returned instead of bytes.
     def raw_data(self, buff):
+        if isinstance(buff, mmap.mmap):
+            buff = memoryview(buff)
+        if isinstance(buff, memoryview):
+            return buff[self.offset:self.offset+self.stored_size()]
+
         buff.seek(self.offset, io.SEEK_SET)
-        if self.compressed:
-            return buff.read(self.compressed_file_size)
-        return buff.read(self.file_size)
+        return buff.read(self.stored_size())
 
 
+    # Always bytes, even from a mapping: only raw_data() hands out views of the archive.
     def data(self, buff):
-        data = self.raw_data(buff)
+        return bytes(self.decompress(self.raw_data(buff)))
+
+
+    def decompress(self, data):
         if self.compressed == 1:
             return zlib.decompressobj(zlib.MAX_WBITS|16).decompress(data)
         elif self.compressed == 3:
-            return zstd.ZstdDecompressor().decompressobj().decompress(data)
+            with _zstd_decompressor() as decompressor:
+                return decompressor.decompressobj().decompress(data)
         return data
 
 
-    def verify_hash(self, buff):
-        hasher = None
-        expected_hash = ""
+    # Yields the decompressed data in chunks of at most chunk_size bytes, reading the raw data
+    # from buff as it goes, so memory use doesn't depend on the size of the entry.
+    def stream(self, buff, chunk_size=STREAM_CHUNK_SIZE):
+        return _stream(self.compressed, _RawEntryReader(buff, self.offset, self.stored_size()), chunk_size)
 
-        if "sha256" in self.extra:
-            hasher = hashlib.sha256()
-            expected_hash = self.extra["sha256"]
-        else:
+
+    # File-like (read-only) access to the decompressed data, see stream().
+    def reader(self, buff, chunk_size=STREAM_CHUNK_SIZE):
+        return WadFileEntryReader(self.stream(buff, chunk_size))
+
+
+    # Redirection entries (type 2) hold the path of the file they point to.
+    def redirection_target(self, buff):
+        raw = self.raw_data(buff)
+        length = struct.unpack_from("<I", raw)[0]
+        return bytes(raw[4:4+length]).decode("utf-8")
+
+
+    # The "sha256" field holds the first 8 bytes of a SHA-256 of the raw data, or its xxh3_64 since
+    # WAD 3.1 (see extra["checksum_type"]).
+    def verify_hash(self, buff):
+        if "sha256" not in self.extra:
             return True
 
-        hasher.update(self.raw_data(buff))
-        calculed_hash = int.from_bytes(hasher.digest()[0:8], byteorder='little')
+        expected_hash = self.extra["sha256"]
+        calculed_hash = _checksum(self.raw_data(buff), self.extra.get("checksum_type", "sha256"))
         return (expected_hash == calculed_hash)
 
 
 
+# Thread-safe LRU of decompressed entries keyed by path hash, bounded by the total size of the
+# cached data. Entries bigger than max_bytes are never cached.
+class WadDataCache(object):
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __repr__(self):
+        return "<WadDataCache {} entries, {}/{} bytes, {} hits, {} misses, {} evictions>".format(
+            len(self._entries), self.size, self.max_bytes, self.hits, self.misses, self.evictions)
+
+
+    def get(self, path_hash):
+        with self._lock:
+            data = self._entries.get(path_hash)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path_hash)
+            self.hits += 1
+            return data
+
+
+    def put(self, path_hash, data):
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            old_data = self._entries.pop(path_hash, None)
+            if old_data is not None:
+                self.size -= len(old_data)
+
+            self._entries[path_hash] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+# The current chunk is kept as a view read from an offset, so small reads don't copy what is left of it.
+class WadFileEntryReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = memoryview(b"")
+        self._position = 0
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, b):
+        while self._position >= len(self._pending):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending.release()
+            self._pending = memoryview(chunk)
+            self._position = 0
+
+        size = min(len(b), len(self._pending) - self._position)
+        b[:size] = self._pending[self._position:self._position+size]
+        self._position += size
+        return size
+
+
+    def close(self):
+        self._pending.release()
+        self._chunks.close()
+        super().close()
+
+
+# Reads the raw data of one entry from a file object (seeking before every read, so the
+# file can be shared) or from a memoryview, without going past the end of the entry.
+class _RawEntryReader(object):
+    def __init__(self, buff, offset, size):
+        if isinstance(buff, mmap.mmap):
+            buff = memoryview(buff)
+        self._buff = buff
+        self._position = offset
+        self._end = offset + size
+
+
+    def read(self, size=-1):
+        if size < 0 or size > self._end - self._position:
+            size = self._end - self._position
+
+        if isinstance(self._buff, memoryview):
+            data = self._buff[self._position:self._position+size]
+        else:
+            self._buff.seek(self._position, io.SEEK_SET)
+            data = self._buff.read(size)
+        self._position += len(data)
+        return data
+
+
+    def close(self):
+        pass
+
+
+# Decompressor contexts are expensive to set up, so idle ones are kept and reused. A context
+# can only serve one decompression at a time, hence the pool instead of a single instance.
+_zstd_decompressors = []
+_zstd_decompressors_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _zstd_decompressor():
+    with _zstd_decompressors_lock:
+        decompressor = _zstd_decompressors.pop() if _zstd_decompressors else None
+    if decompressor is None:
+        decompressor = zstd.ZstdDecompressor()
+
+    try:
+        yield decompressor
+    finally:
+        with _zstd_decompressors_lock:
+            _zstd_decompressors.append(decompressor)
+
+
+def _stream(compressed, raw_reader, chunk_size):
+    if compressed == 1:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS|16)
+        while not decompressor.eof:
+            data = decompressor.unconsumed_tail or raw_reader.read(chunk_size)
+            if not data:
+                break
+            chunk = decompressor.decompress(data, chunk_size)
+            if chunk:
+                yield chunk
+
+    elif compressed == 3:
+        with _zstd_decompressor() as decompressor:
+            with decompressor.stream_reader(raw_reader, read_size=chunk_size) as reader:
+                while True:
+                    chunk = reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    else:
+        while True:
+            chunk = raw_reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
 class WadFile(object):
-    def __init__(self, file_path):
+    # With use_mmap the archive is mapped once and kept open until close(), raw entries are
+    # then handed out as memoryview slices of the mapping instead of seek + read copies.
+    # With cache_size, data() keeps up to cache_size bytes of decompressed entries (see WadDataCache).
+    def __init__(self, file_path, use_mmap=False, cache_size=0):
         self.path = file_path
         self.file_headers = {}
         self.version = 0
+        self.version_minor = 0
+        self.cache = WadDataCache(cache_size) if cache_size else None
+        self._file = None
+        self._mmap = None
+        self._view = None
         self._load_headers()
 
+        if use_mmap:
+            self._map()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def _map(self):
+        self._file = io.open(self.path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty files can't be mapped
+            self._file.close()
+            self._file = None
+            return
+        self._view = memoryview(self._mmap)
+
+
+    # Raises BufferError while memoryviews returned by raw_data() are still alive.
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    @property
+    def mapped(self):
+        return self._view is not None
+
+
+    # Yields the buffer that WadFileHeader methods read from: the mapping when available,
+    # otherwise a freshly opened file object.
+    @contextlib.contextmanager
+    def open(self):
+        if self._view is not None:
+            yield self._view
+        else:
+            with io.open(self.path, "rb") as buff:
+                yield buff
+
+
+    def _get_header(self, hashed_file_name):
+        if isinstance(hashed_file_name, str):
+            hashed_file_name = hashed_file_name.lower()
+        if hashed_file_name not in self.file_headers:
+            raise KeyError("The file {} is not known on this WAD.".format(hashed_file_name))
+        return self.file_headers[hashed_file_name]
+
+
+    def raw_data(self, hashed_file_name):
+        file_header = self._get_header(hashed_file_name)
+        with self.open() as buff:
+            return file_header.raw_data(buff)
+
+
+    def data(self, hashed_file_name):
+        file_header = self._get_header(hashed_file_name)
+        if self.cache is None:
+            with self.open() as buff:
+                return file_header.data(buff)
+
+        path_hash = int(file_header.hashed_file_name, 16)
+        data = self.cache.get(path_hash)
+        if data is None:
+            with self.open() as buff:
+                data = file_header.data(buff)
+            self.cache.put(path_hash, data)
+        return data
+
+
+    # See diff_wads(), self being the old version.
+    def diff(self, other, compare_payloads=True):
+        return diff_wads(self, other, compare_payloads)
+
+
+    # See verify_wads().
+    def verify_all(self, workers=None, executor="thread", max_in_flight=EXTRACT_MAX_IN_FLIGHT, batch_size=VERIFY_BATCH_SIZE):
+        return verify_wads([self], workers, executor, max_in_flight, batch_size)[self.path]
+
+
+    # Extracts the entries given in files (paths, hashed file names or path hashes) plus the entries
+    # of names (known paths, e.g. from a hash list) matching the glob pattern or the regex. Entries
+    # are read in offset order from a single open of the archive, and written with their real
+    # relative path when it is known. Returns the list of written files.
+    def extract_files(self, directory, files=(), pattern=None, regex=None, names=()):
+        selected = {}
+        for key in files:
+            path_hash = _to_path_hash(key)
+            if path_hash not in self.file_headers:
+                print("The file {} is not known on this WAD.".format(key))
+                continue
+            is_name = isinstance(key, str) and path_hash != _hex_path_hash(key)
+            selected[path_hash] = key if is_name else selected.get(path_hash)
+
+        if pattern is not None or regex is not None:
+            if pattern is not None:
+                pattern = pattern.lower()
+            if isinstance(regex, str):
+                regex = re.compile(regex, re.IGNORECASE)
+
+            for name in names:
+                if pattern is not None and not fnmatch.fnmatchcase(name.lower(), pattern):
+                    continue
+                if regex is not None and not regex.search(name):
+                    continue
+                path_hash = _to_path_hash(name)
+                if path_hash in self.file_headers:
+                    selected[path_hash] = name
+
+        os.makedirs(directory, exist_ok=True)
+        file_headers = sorted(((self.file_headers[path_hash], name) for path_hash, name in selected.items()), key=lambda h: h[0].offset)
+        written = []
+        with self.open() as buff:
+            for file_header, name in file_headers:
+                if file_header.compressed == 2: # Redirection
+                    continue
+                file_header.extract(directory, buff, name)
+                written.append(os.path.join(directory, name.lstrip("/") if name else file_header.hashed_file_name))
+        return written
+
 
     def extract_file(self, hashed_file_name, directory):
         os.makedirs(directory, exist_ok=True)
@@ -78,15 +450,64 @@ class WadFile(object):
         if hashed_file_name not in self.file_headers:
             print("The file {} is not known on this WAD.".format(hashed_file_name))
         else:
-            with io.open(self.path, "rb") as buff:
+            with self.open() as buff:
                 self.file_headers[hashed_file_name].extract(directory, buff)
 
 
-    def extract_all(self, directory):
+    # With workers > 1 entries are read in offset order and decompressed/written on a thread or
+    # process pool ("thread" or "process"), keeping at most max_in_flight bytes queued.
+    # With dedup, entries sharing the same data are decompressed once and the others are linked
+    # to it (link is "hardlink" or "copy"). With resolve_redirections, redirection entries are
+    # linked to the file they point to when it is part of this WAD.
+    def extract_all(self, directory, workers=1, executor="thread", max_in_flight=EXTRACT_MAX_IN_FLIGHT, dedup=False, link="hardlink", resolve_redirections=False):
+        if link not in ("hardlink", "copy"):
+            raise ValueError("Unknown link mode '{}', expected 'hardlink' or 'copy'.".format(link))
+
         os.makedirs(directory, exist_ok=True)
-        with io.open(self.path, "rb") as buff:
-            for file_header in self.file_headers.values():
-                file_header.extract(directory, buff)
+        stats = WadExtractStats()
+        file_headers = []
+        aliases = []
+        redirections = []
+        extracted = {}
+        for file_header in self.file_headers.values():
+            stats.entries += 1
+            if file_header.compressed == 2: # Redirection
+                stats.redirections += 1
+                redirections.append(file_header)
+                continue
+
+            span = (file_header.offset, file_header.compressed_file_size, file_header.file_size, file_header.compressed)
+            if dedup and span in extracted:
+                stats.aliases += 1
+                stats.bytes_saved += file_header.file_size
+                aliases.append((file_header, extracted[span]))
+                continue
+
+            extracted[span] = file_header
+            stats.extracted += 1
+            stats.bytes_written += file_header.file_size
+            file_headers.append(file_header)
+
+        if workers is not None and workers <= 1:
+            with self.open() as buff:
+                for file_header in file_headers:
+                    file_header.extract(directory, buff)
+        else:
+            _parallel_extract(self, file_headers, directory, workers, executor, max_in_flight)
+
+        for file_header, source in aliases:
+            _link_file(directory, source, file_header, link)
+
+        if resolve_redirections:
+            with self.open() as buff:
+                for file_header in redirections:
+                    target = self.file_headers.get(WadFile.hash(file_header.redirection_target(buff)))
+                    if target is None or target.compressed == 2:
+                        continue
+                    _link_file(directory, target, file_header, link)
+                    stats.redirections_resolved += 1
+
+        return stats
 
 
     def _load_headers(self):
@@ -106,11 +527,14 @@ class WadFile(object):
                 raise NotImplementedError("A parser for wad version {} is not implemented.".format(version_major))
 
             self.version = version_major
+            self.version_minor = version_minor
+            if version_major == 3 and version_minor >= 1:
+                self.file_headers.checksum_type = "xxh3"
 
 
     @staticmethod
     def hash(string, directory=None):
-        hashed_name = xxhash.xxh64(string.lower(), seed=0).hexdigest()
+        hashed_name = xxhash.xxh64(string.lower().encode("utf-8"), seed=0).hexdigest()
         hashed_name = ensure_16_digits(hashed_name)
 
         if directory:
@@ -118,27 +542,445 @@ class WadFile(object):
         return hashed_name
 
 
-def _parse_wad_v1(buff):
-    entry_header_offset, entry_header_cell_size, files_count = struct.unpack("<HHI", buff.read(8))
+    # Path hashes (as in the TOC, the integer form of hash()) of many strings, as an array('Q').
+    @staticmethod
+    def hash_many(strings):
+        xxh64_intdigest = xxhash.xxh64_intdigest
+        return array.array("Q", [xxh64_intdigest(string.lower().encode("utf-8")) for string in strings])
+
+
+class WadExtractStats(object):
+    def __init__(self):
+        self.entries = 0
+        self.extracted = 0
+        self.aliases = 0
+        self.redirections = 0
+        self.redirections_resolved = 0
+        self.bytes_written = 0
+        self.bytes_saved = 0
+
 
-    wad_file_struct = struct.Struct("<QIIII")
-    file_headers = {}
-    for _ in range(files_count):
-        path_hash, offset, compressed_file_size, file_size, compressed = wad_file_struct.unpack(buff.read(wad_file_struct.size))
+    def __repr__(self):
+        return "<WadExtractStats {} entries, {} extracted, {} aliases, {}/{} redirections resolved, {} bytes written, {} bytes saved>".format(
+            self.entries, self.extracted, self.aliases, self.redirections_resolved, self.redirections, self.bytes_written, self.bytes_saved)
 
-        hashed_file_name = hex(path_hash)[2:]
-        hashed_file_name = ensure_16_digits(hashed_file_name)
 
-        file_headers[hashed_file_name] = WadFileHeader(
-            hashed_file_name,
-            offset,
-            compressed_file_size,
-            file_size,
-            compressed,
-            {}
-        )
+def _link_file(directory, source, file_header, link):
+    source_name = os.path.join(directory, source.hashed_file_name)
+    file_name = os.path.join(directory, file_header.hashed_file_name)
+    if os.path.lexists(file_name):
+        os.remove(file_name)
 
-    return file_headers
+    if link == "hardlink":
+        try:
+            os.link(source_name, file_name)
+            return
+        except OSError: # Not supported by the file system, fall back to a copy
+            pass
+    shutil.copyfile(source_name, file_name)
+
+
+class _ByteBudget(object):
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+
+    # A single item bigger than the limit is still let through once nothing else is in flight.
+    def acquire(self, size):
+        with self._condition:
+            while self.in_flight and self.in_flight + size > self.limit:
+                self._condition.wait()
+            self.in_flight += size
+
+
+    def release(self, size):
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+# Each pool process maps an archive the first time it needs it and reads its own entries from it.
+_worker_wads = {}
+
+
+def _worker_wad(path):
+    if path not in _worker_wads:
+        _worker_wads[path] = WadFile(path, use_mmap=True)
+    return _worker_wads[path]
+
+
+def _make_pool(workers, executor):
+    if executor == "thread":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    elif executor == "process":
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    raise ValueError("Unknown executor '{}', expected 'thread' or 'process'.".format(executor))
+
+
+def _extract_in_worker(path, file_header, directory):
+    with _worker_wad(path).open() as buff:
+        file_header.extract(directory, buff)
+
+
+def _parallel_extract(wad, file_headers, directory, workers, executor, max_in_flight):
+    pool = _make_pool(workers, executor)
+
+    budget = _ByteBudget(max_in_flight)
+    futures = []
+    with pool, wad.open() as buff:
+        for file_header in sorted(file_headers, key=lambda h: h.offset):
+            cost = file_header.stored_size() + file_header.file_size
+            budget.acquire(cost)
+            if executor == "thread":
+                future = pool.submit(file_header.extract_raw, directory, file_header.raw_data(buff))
+            else:
+                future = pool.submit(_extract_in_worker, wad.path, file_header, directory)
+            future.add_done_callback(lambda _, cost=cost: budget.release(cost))
+            futures.append(future)
+
+    for future in futures:
+        future.result()
+
+
+class WadVerifyMismatch(object):
+    def __init__(self, hashed_file_name, offset, expected_hash, calculed_hash):
+        self.hashed_file_name = hashed_file_name
+        self.offset = offset
+        self.expected_hash = expected_hash
+        self.calculed_hash = calculed_hash
+
+
+    def __repr__(self):
+        return "<WadVerifyMismatch {} expected {:016x} got {:016x}>".format(self.hashed_file_name, self.expected_hash, self.calculed_hash)
+
+
+# error is set when the archive could not be read (e.g. a truncated table of contents).
+class WadVerifyReport(object):
+    def __init__(self, path, checksum_type, error=None):
+        self.path = path
+        self.checksum_type = checksum_type
+        self.checked = 0
+        self.skipped = 0
+        self.mismatches = []
+        self.error = error
+
+
+    @property
+    def ok(self):
+        return not self.mismatches and self.error is None
+
+
+    def __repr__(self):
+        if self.error is not None:
+            return "<WadVerifyReport {}: error: {}>".format(self.path, self.error)
+        return "<WadVerifyReport {}: {} checked, {} skipped, {} mismatches>".format(self.path, self.checked, self.skipped, len(self.mismatches))
+
+
+def _checksum(data, checksum_type):
+    if checksum_type == "xxh3":
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.sha256(data).digest()[0:8], byteorder='little')
+
+
+# entries are raw TOC entries, data the matching raw entry data.
+def _verify_entries(entries, data, checksum_type):
+    mismatches = []
+    for entry, raw in zip(entries, data):
+        calculed_hash = _checksum(raw, checksum_type)
+        if calculed_hash != entry[8]:
+            mismatches.append(WadVerifyMismatch("{:016x}".format(entry[0]), entry[1], entry[8], calculed_hash))
+    return mismatches
+
+
+def _verify_in_worker(path, entries, checksum_type):
+    with _worker_wad(path).open() as buff:
+        return _verify_entries(entries, [_read_entry(buff, entry) for entry in entries], checksum_type)
+
+
+def _read_entry(buff, entry):
+    path_hash, offset, compressed_file_size, file_size, compressed = entry[:5]
+    size = compressed_file_size if compressed else file_size
+    if isinstance(buff, memoryview):
+        return buff[offset:offset+size]
+    buff.seek(offset, io.SEEK_SET)
+    return buff.read(size)
+
+
+# Verifies the checksum of every entry of several WADs (WadFile objects or paths). Entries of each
+# archive are read in offset order and hashed on a shared pool in batches of up to batch_size bytes.
+# Archives that can't be read get a report with its error set.
+def verify_wads(wads, workers=None, executor="thread", max_in_flight=EXTRACT_MAX_IN_FLIGHT, batch_size=VERIFY_BATCH_SIZE):
+    pool = _make_pool(workers, executor)
+    budget = _ByteBudget(max_in_flight)
+    reports = {}
+    futures = []
+    opened = []
+
+    def submit(report, buff, batch, batch_bytes):
+        budget.acquire(batch_bytes)
+        if executor == "thread":
+            future = pool.submit(_verify_entries, batch, [_read_entry(buff, entry) for entry in batch], report.checksum_type)
+        else:
+            future = pool.submit(_verify_in_worker, report.path, batch, report.checksum_type)
+        future.add_done_callback(lambda _: budget.release(batch_bytes))
+        futures.append((report, future))
+
+    with pool:
+        for wad in wads:
+            if not isinstance(wad, WadFile):
+                try:
+                    wad = WadFile(wad, use_mmap=True)
+                except (NotImplementedError, ValueError) as e:
+                    reports[wad] = WadVerifyReport(wad, None, error=str(e))
+                    continue
+                opened.append(wad)
+            toc = wad.file_headers
+            report = reports[wad.path] = WadVerifyReport(wad.path, toc.checksum_type)
+            if toc.checksum_type is None:
+                report.skipped = len(toc)
+                continue
+
+            with wad.open() as buff:
+                batch, batch_bytes = [], 0
+                for entry in sorted(toc.entries(), key=lambda e: e[1]):
+                    report.checked += 1
+                    batch.append(entry)
+                    batch_bytes += entry[2] if entry[4] else entry[3]
+                    if batch_bytes >= batch_size:
+                        submit(report, buff, batch, batch_bytes)
+                        batch, batch_bytes = [], 0
+                if batch:
+                    submit(report, buff, batch, batch_bytes)
+
+        for report, future in futures:
+            report.mismatches.extend(future.result())
+        futures = None
+
+    for wad in opened:
+        wad.close()
+
+    for report in reports.values():
+        report.mismatches.sort(key=lambda m: m.offset)
+    return reports
+
+
+class WadDiff(object):
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        self.unchanged = []
+        # Entries that had to be compared by reading their data
+        self.payloads_compared = 0
+
+
+    def __repr__(self):
+        return "<WadDiff {} added, {} removed, {} changed, {} unchanged>".format(len(self.added), len(self.removed), len(self.changed), len(self.unchanged))
+
+
+# Classifies the entries of two versions of a WAD by hashed file name, using only their TOCs:
+# sizes, compression type and the stored checksum. Entries without a comparable checksum (v1,
+# or different checksum types) but with the same size are compared by hashing their data,
+# unless compare_payloads is False, in which case they are reported as changed.
+def diff_wads(old, new, compare_payloads=True):
+    old_toc, new_toc = old.file_headers, new.file_headers
+    use_checksums = old_toc.checksum_type is not None and old_toc.checksum_type == new_toc.checksum_type
+
+    diff = WadDiff()
+    undecided = []
+    old_entries, new_entries = old_toc.sorted_entries(), new_toc.sorted_entries()
+    old_entry, new_entry = next(old_entries, None), next(new_entries, None)
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or (old_entry is not None and old_entry[0] < new_entry[0]):
+            diff.removed.append("{:016x}".format(old_entry[0]))
+            old_entry = next(old_entries, None)
+            continue
+        if old_entry is None or new_entry[0] < old_entry[0]:
+            diff.added.append("{:016x}".format(new_entry[0]))
+            new_entry = next(new_entries, None)
+            continue
+
+        hashed_file_name = "{:016x}".format(new_entry[0])
+        if old_entry[3] != new_entry[3]:
+            diff.changed.append(hashed_file_name)
+        elif use_checksums:
+            if old_entry[2:5] == new_entry[2:5] and old_entry[8] == new_entry[8]:
+                diff.unchanged.append(hashed_file_name)
+            else:
+                diff.changed.append(hashed_file_name)
+        elif compare_payloads:
+            undecided.append((old_entry, new_entry))
+        else:
+            diff.changed.append(hashed_file_name)
+        old_entry, new_entry = next(old_entries, None), next(new_entries, None)
+
+    if undecided:
+        old_hashes = _payload_hashes(old, [entries[0] for entries in undecided])
+        new_hashes = _payload_hashes(new, [entries[1] for entries in undecided])
+        for old_entry, new_entry in undecided:
+            hashed_file_name = "{:016x}".format(new_entry[0])
+            if old_hashes[old_entry[0]] == new_hashes[new_entry[0]]:
+                diff.unchanged.append(hashed_file_name)
+            else:
+                diff.changed.append(hashed_file_name)
+        diff.payloads_compared = len(undecided)
+        diff.changed.sort()
+        diff.unchanged.sort()
+
+    return diff
+
+
+# Hashes the decompressed data of the given raw TOC entries, read in offset order.
+def _payload_hashes(wad, entries):
+    hashes = {}
+    with wad.open() as buff:
+        for entry in sorted(entries, key=lambda e: e[1]):
+            hasher = xxhash.xxh3_64()
+            for chunk in _stream(entry[4], _RawEntryReader(buff, entry[1], entry[2] if entry[4] else entry[3]), STREAM_CHUNK_SIZE):
+                hasher.update(chunk)
+            hashes[entry[0]] = hasher.intdigest()
+    return hashes
+
+
+# Entries are kept as the packed TOC bytes; hashed_file_name lookups binary search the sorted
+# path hash column and WadFileHeader objects are only built when an entry is accessed.
+class WadFileToc(collections.abc.Mapping):
+    def __init__(self, raw, entry_struct, version):
+        self.raw = raw
+        self.version = version
+        self.checksum_type = None if version == 1 else "sha256"
+        self._struct = entry_struct
+        self._order = None
+
+        # The path hash is the first u64 of every entry, so it is a strided view of the TOC
+        hashes = array.array("Q")
+        hashes.frombytes(memoryview(raw).cast("Q")[::entry_struct.size // 8].tobytes())
+        if sys.byteorder != "little":
+            hashes.byteswap()
+
+        if any(a > b for a, b in zip(hashes, itertools.islice(hashes, 1, None))):
+            self._order = array.array("I", sorted(range(len(hashes)), key=hashes.__getitem__))
+            hashes = array.array("Q", (hashes[idx] for idx in self._order))
+        self.path_hashes = hashes
+
+
+    def __len__(self):
+        return len(self.path_hashes)
+
+
+    def __iter__(self):
+        for path_hash in self.path_hashes:
+            yield "{:016x}".format(path_hash)
+
+
+    def __contains__(self, hashed_file_name):
+        return self.index(hashed_file_name) is not None
+
+
+    def __getitem__(self, hashed_file_name):
+        idx = self.index(hashed_file_name)
+        if idx is None:
+            raise KeyError(hashed_file_name)
+        return self.header(idx)
+
+
+    def values(self):
+        return _WadFileTocValuesView(self)
+
+
+    def items(self):
+        return _WadFileTocItemsView(self)
+
+
+    # Accepts the hashed file name (hex string) or the integer path hash, returns the
+    # position of the entry on the TOC or None.
+    def index(self, hashed_file_name):
+        if isinstance(hashed_file_name, int):
+            path_hash = hashed_file_name
+        else:
+            try:
+                path_hash = int(hashed_file_name, 16)
+            except (TypeError, ValueError):
+                return None
+
+        idx = bisect.bisect_left(self.path_hashes, path_hash)
+        if idx == len(self.path_hashes) or self.path_hashes[idx] != path_hash:
+            return None
+        if self._order is not None:
+            return self._order[idx]
+        return idx
+
+
+    # Raw unpacked entry: path_hash, offset, compressed_file_size, file_size, compressed[, duplicate, ukn1, ukn2, sha256]
+    def entry(self, idx):
+        return self._struct.unpack_from(self.raw, idx * self._struct.size)
+
+
+    # In TOC order, see sorted_entries() for path hash order.
+    def entries(self):
+        return self._struct.iter_unpack(self.raw)
+
+
+    def sorted_entries(self):
+        if self._order is None:
+            return self.entries()
+        return (self.entry(idx) for idx in self._order)
+
+
+    def header(self, idx):
+        return _make_header(self.entry(idx), self.version, self.checksum_type)
+
+
+    def headers(self):
+        for entry in self.sorted_entries():
+            yield _make_header(entry, self.version, self.checksum_type)
+
+
+class _WadFileTocValuesView(collections.abc.ValuesView):
+    def __iter__(self):
+        return self._mapping.headers()
+
+
+class _WadFileTocItemsView(collections.abc.ItemsView):
+    def __iter__(self):
+        for file_header in self._mapping.headers():
+            yield (file_header.hashed_file_name, file_header)
+
+
+def _make_header(entry, version, checksum_type):
+    if version == 1:
+        path_hash, offset, compressed_file_size, file_size, compressed = entry
+        extra = {}
+    else:
+        path_hash, offset, compressed_file_size, file_size, compressed, duplicate, ukn1, ukn2, sha256 = entry
+        extra = {
+            "duplicate":    duplicate,
+            "ukn1":         ukn1,
+            "ukn2":         ukn2,
+            "sha256":       sha256,
+            "checksum_type": checksum_type,
+        }
+
+    return WadFileHeader(
+        "{:016x}".format(path_hash),
+        offset,
+        compressed_file_size,
+        file_size,
+        compressed,
+        extra
+    )
+
+
+_wad_v1_file_struct = struct.Struct("<QIIII")
+_wad_v2_file_struct = struct.Struct("<QIIIBBBBQ")
+
+
+def _parse_wad_v1(buff):
+    entry_header_offset, entry_header_cell_size, files_count = struct.unpack("<HHI", buff.read(8))
+
+    return _read_toc(buff, files_count, _wad_v1_file_struct, 1)
 
 
 def _parse_wad_v2(buff):
@@ -149,29 +991,7 @@ def _parse_wad_v2(buff):
 
     files_checksum, entry_header_offset, entry_header_cell_size, files_count = struct.unpack("<QHHI", buff.read(16))
 
-    wad_file_struct = struct.Struct("<QIIIBBBBQ")
-    file_headers = {}
-    for _ in range(files_count):
-        path_hash, offset, compressed_file_size, file_size, compressed, duplicate, ukn1, ukn2, sha256 = wad_file_struct.unpack(buff.read(wad_file_struct.size))
-
-        hashed_file_name = hex(path_hash)[2:]
-        hashed_file_name = ensure_16_digits(hashed_file_name)
-
-        file_headers[hashed_file_name] = WadFileHeader(
-            hashed_file_name,
-            offset,
-            compressed_file_size,
-            file_size,
-            compressed,
-            {
-                "duplicate":    duplicate,
-                "ukn1":         ukn1,
-                "ukn2":         ukn2,
-                "sha256":       sha256,
-            }
-        )
-
-    return file_headers
+    return _read_toc(buff, files_count, _wad_v2_file_struct, 2)
 
 
 def _parse_wad_v3(buff):
@@ -179,29 +999,33 @@ def _parse_wad_v3(buff):
 
     files_checksum, files_count = struct.unpack("<QI", buff.read(12))
 
-    wad_file_struct = struct.Struct("<QIIIBBBBQ")
-    file_headers = {}
-    for _ in range(files_count):
-        path_hash, offset, compressed_file_size, file_size, compressed, duplicate, ukn1, ukn2, sha256 = wad_file_struct.unpack(buff.read(wad_file_struct.size))
-
-        hashed_file_name = hex(path_hash)[2:]
-        hashed_file_name = ensure_16_digits(hashed_file_name)
-
-        file_headers[hashed_file_name] = WadFileHeader(
-            hashed_file_name,
-            offset,
-            compressed_file_size,
-            file_size,
-            compressed,
-            {
-                "duplicate":    duplicate,
-                "ukn1":         ukn1,
-                "ukn2":         ukn2,
-                "sha256":       sha256,
-            }
-        )
-
-    return file_headers
+    return _read_toc(buff, files_count, _wad_v2_file_struct, 3)
+
+
+def _read_toc(buff, files_count, entry_struct, version):
+    raw = buff.read(files_count * entry_struct.size)
+    if len(raw) != files_count * entry_struct.size:
+        raise ValueError("The wad table of contents is truncated: {} entries ({} bytes) expected, {} bytes found.".format(files_count, files_count * entry_struct.size, len(raw)))
+    return WadFileToc(raw, entry_struct, version)
+
+
+def _hex_path_hash(string):
+    if len(string) != 16:
+        return None
+    try:
+        return int(string, 16)
+    except ValueError:
+        return None
+
+
+# Accepts a path hash, a hashed file name or a plain path.
+def _to_path_hash(key):
+    if isinstance(key, int):
+        return key
+    path_hash = _hex_path_hash(key)
+    if path_hash is None:
+        path_hash = int(WadFile.hash(key), 16)
+    return path_hash
 
 
 def ensure_16_digits(string):
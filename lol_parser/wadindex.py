@@ -0,0 +1,290 @@
+import array
+import bisect
+import heapq
+import io
+import itertools
+import mmap
+import os
+import os.path
+import struct
+import sys
+import xxhash
+
+from .wadfile import WadFile, WadFileHeader, _to_path_hash
+
+WAD_EXTENSIONS = (".wad", ".wad.client", ".wad.mobile")
+
+# Index file layout (little endian):
+#   header:   magic "LWIX", format version, archives count, entries count
+#   root:     u16 length + utf-8 path of the scanned directory
+#   archives: u16 length + utf-8 path relative to root, u64 size, u64 mtime_ns, u64 TOC xxh64
+#   hashes:   entries count * u64 path hash, sorted
+#   entries:  entries count * (u32 archive, u32 offset, u32 compressed size, u32 size, u8 compressed)
+_INDEX_MAGIC = b"LWIX"
+_INDEX_VERSION = 1
+_index_header_struct = struct.Struct("<4sIII")
+_index_archive_struct = struct.Struct("<QQQ")
+_index_entry_struct = struct.Struct("<IIIIB")
+_archive_entry_struct = struct.Struct("<IIIB")
+
+
+class WadIndexEntry(object):
+    def __init__(self, wad_path, path_hash, offset, compressed_file_size, file_size, compressed):
+        self.wad_path = wad_path
+        self.path_hash = path_hash
+        self.offset = offset
+        self.compressed_file_size = compressed_file_size
+        self.file_size = file_size
+        self.compressed = compressed
+
+    def __repr__(self):
+        return "<WadIndexEntry {} in {}>".format(self.hashed_file_name, self.wad_path)
+
+    @property
+    def hashed_file_name(self):
+        return "{:016x}".format(self.path_hash)
+
+    def header(self):
+        return WadFileHeader(self.hashed_file_name, self.offset, self.compressed_file_size, self.file_size, self.compressed, {})
+
+    # Only the archive holding the entry is opened, its TOC is not parsed.
+    def raw_data(self):
+        with io.open(self.wad_path, "rb") as buff:
+            return self.header().raw_data(buff)
+
+    def data(self):
+        with io.open(self.wad_path, "rb") as buff:
+            return self.header().data(buff)
+
+
+class _WadIndexArchive(object):
+    # hashes is a sorted array('Q') and entries the matching packed _archive_entry_struct records.
+    def __init__(self, path, size, mtime, toc_checksum, hashes=None, entries=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.toc_checksum = toc_checksum
+        self.hashes = hashes
+        self.entries = entries
+
+
+class WadIndex(object):
+    def __init__(self, index_path):
+        self.path = index_path
+        self.root = None
+        self.archives = []
+        self._mmap = None
+        self._hashes = array.array("Q")
+        self._entries = b""
+
+        if os.path.exists(self.path):
+            self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        path_hash = _to_path_hash(key)
+        idx = bisect.bisect_left(self._hashes, path_hash)
+        return idx < len(self._hashes) and self._hashes[idx] == path_hash
+
+    def close(self):
+        if self._mmap is not None:
+            for view in (self._hashes, self._entries):
+                if isinstance(view, memoryview):
+                    view.release()
+            self._mmap.close()
+            self._mmap = None
+        self._hashes = array.array("Q")
+        self._entries = b""
+
+    # An existing index that can't be read (other format version, truncated file) is rebuilt.
+    @staticmethod
+    def build(root, index_path):
+        try:
+            index = WadIndex(index_path)
+        except (NotImplementedError, ValueError) as e:
+            print("WARNING: {} Rebuilding it.".format(e))
+            os.remove(index_path)
+            index = WadIndex(index_path)
+        index.update(root)
+        return index
+
+    # Rescans root and rewrites the index. Archives whose size and mtime did not change are
+    # reused as is, the others are only re-indexed when the checksum of their TOC changed.
+    def update(self, root):
+        root = os.path.abspath(root)
+        known = {}
+        if self.root == root:
+            known = {archive.path: archive for archive in self.archives}
+
+        archives = []
+        changed = len(known) == 0 or self.root != root
+        for path in _find_wads(root):
+            rel_path = os.path.relpath(path, root)
+            stat = os.stat(path)
+            archive = known.pop(rel_path, None)
+            if archive and archive.size == stat.st_size and archive.mtime == stat.st_mtime_ns:
+                archives.append(archive)
+                continue
+
+            try:
+                wad = WadFile(path)
+            except (NotImplementedError, ValueError) as e:
+                print("WARNING: Skipping {}: {}".format(path, e))
+                changed = changed or archive is not None # Its entries are dropped from the index
+                continue
+
+            toc_checksum = xxhash.xxh64(wad.file_headers.raw).intdigest()
+            if archive is None or archive.toc_checksum != toc_checksum:
+                archive = _index_wad(rel_path, stat, toc_checksum, wad)
+            else:
+                archive.size, archive.mtime = stat.st_size, stat.st_mtime_ns
+            archives.append(archive)
+            changed = True
+
+        if not changed and not known:
+            return self
+
+        self._load_archive_entries()
+        self.close()
+        self.root = root
+        self.archives = archives
+        self._write()
+        self._load()
+        return self
+
+    # Returns every indexed entry for key (path hash, hashed file name or plain path), as the
+    # same file can live in several archives.
+    def find(self, key):
+        path_hash = _to_path_hash(key)
+        start = bisect.bisect_left(self._hashes, path_hash)
+        end = bisect.bisect_right(self._hashes, path_hash, lo=start)
+
+        found = []
+        for idx in range(start, end):
+            archive_idx, offset, compressed_file_size, file_size, compressed = _index_entry_struct.unpack_from(self._entries, idx * _index_entry_struct.size)
+            wad_path = os.path.join(self.root, self.archives[archive_idx].path)
+            found.append(WadIndexEntry(wad_path, path_hash, offset, compressed_file_size, file_size, compressed))
+        return found
+
+    def data(self, key):
+        found = self.find(key)
+        if not found:
+            raise KeyError("The file {} is not known on this index.".format(key))
+        return found[0].data()
+
+    def _load(self):
+        if os.path.getsize(self.path) < _index_header_struct.size:
+            raise ValueError("The wad index {} is truncated.".format(self.path))
+        with io.open(self.path, "rb") as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        try:
+            self._load_tables(view)
+        except (NotImplementedError, struct.error, TypeError, ValueError) as e:
+            view.release()
+            self.close()
+            self.root, self.archives = None, []
+            if isinstance(e, NotImplementedError):
+                raise
+            raise ValueError("The wad index {} is truncated or corrupted: {}".format(self.path, e))
+        view.release()
+
+    def _load_tables(self, view):
+        magic, version, archives_count, entries_count = _index_header_struct.unpack_from(view, 0)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise NotImplementedError("The format of the wad index {} is unknown.".format(self.path))
+        pos = _index_header_struct.size
+
+        self.root, pos = _unpack_string(view, pos)
+        self.archives = []
+        for _ in range(archives_count):
+            path, pos = _unpack_string(view, pos)
+            size, mtime, toc_checksum = _index_archive_struct.unpack_from(view, pos)
+            pos += _index_archive_struct.size
+            self.archives.append(_WadIndexArchive(path, size, mtime, toc_checksum))
+
+        hashes_end = pos + entries_count * 8
+        if sys.byteorder == "little":
+            self._hashes = view[pos:hashes_end].cast("Q")
+        else:
+            self._hashes = array.array("Q", view[pos:hashes_end].tobytes())
+            self._hashes.byteswap()
+        entries_end = hashes_end + entries_count * _index_entry_struct.size
+        if entries_end > len(view):
+            raise ValueError("{} bytes of entries expected, {} found".format(entries_end - hashes_end, len(view) - hashes_end))
+        self._entries = view[hashes_end:entries_end]
+
+    # Splits the loaded global tables back into per archive tables, so unchanged archives can
+    # be written again without being re-read.
+    def _load_archive_entries(self):
+        for archive in self.archives:
+            archive.hashes, archive.entries = array.array("Q"), bytearray()
+
+        for path_hash, entry in zip(self._hashes, _index_entry_struct.iter_unpack(self._entries)):
+            archive = self.archives[entry[0]]
+            archive.hashes.append(path_hash)
+            archive.entries += _archive_entry_struct.pack(*entry[1:])
+
+    def _write(self):
+        merged = heapq.merge(*(
+            zip(archive.hashes, itertools.repeat(archive_idx), range(len(archive.hashes)))
+            for archive_idx, archive in enumerate(self.archives)
+        ))
+
+        hashes = array.array("Q")
+        entries = bytearray()
+        for path_hash, archive_idx, idx in merged:
+            hashes.append(path_hash)
+            entry = _archive_entry_struct.unpack_from(self.archives[archive_idx].entries, idx * _archive_entry_struct.size)
+            entries += _index_entry_struct.pack(archive_idx, *entry)
+        if sys.byteorder != "little":
+            hashes.byteswap()
+
+        tmp_path = self.path + ".tmp"
+        with io.open(tmp_path, "wb") as index_file:
+            index_file.write(_index_header_struct.pack(_INDEX_MAGIC, _INDEX_VERSION, len(self.archives), len(entries) // _index_entry_struct.size))
+            index_file.write(_pack_string(self.root))
+            for archive in self.archives:
+                index_file.write(_pack_string(archive.path))
+                index_file.write(_index_archive_struct.pack(archive.size, archive.mtime, archive.toc_checksum))
+            index_file.write(hashes.tobytes())
+            index_file.write(entries)
+        os.replace(tmp_path, self.path)
+
+
+def _find_wads(root):
+    for directory, sub_directories, files in os.walk(root):
+        sub_directories.sort()
+        for file_name in sorted(files):
+            if file_name.lower().endswith(WAD_EXTENSIONS):
+                yield os.path.join(directory, file_name)
+
+
+def _index_wad(rel_path, stat, toc_checksum, wad):
+    hashes = array.array("Q")
+    entries = bytearray()
+    for entry in sorted(wad.file_headers.entries()):
+        path_hash, offset, compressed_file_size, file_size, compressed = entry[:5]
+        hashes.append(path_hash)
+        entries += _archive_entry_struct.pack(offset, compressed_file_size, file_size, compressed)
+    return _WadIndexArchive(rel_path, stat.st_size, stat.st_mtime_ns, toc_checksum, hashes, entries)
+
+
+def _pack_string(string):
+    data = string.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_string(view, pos):
+    length = struct.unpack_from("<H", view, pos)[0]
+    pos += 2
+    return bytes(view[pos:pos+length]).decode("utf-8"), pos + length